@@ -1,17 +1,30 @@
 '''post changesets to a reviewboard server'''
 
-import os, errno, re, sys
+import os, errno, re, sys, time
 import cStringIO
 import operator
 
-from mercurial import cmdutil, hg, ui, mdiff, patch, util, localrepo
+from mercurial import cmdutil, error, hg, ui, mdiff, patch, util, localrepo
+from mercurial.node import bin, hex, nullrev
 from mercurial.i18n import _
 
-from reviewboard import make_rbclient, ReviewBoardError
+# Mercurial loads the extension for every command, so only what is needed to
+# register it is imported here.  The modules with the HTTP and JSON code, the
+# diff machinery and the worker threads are imported by the functions that
+# use them, once postreview runs.
+from debugsink import DiffSink, debug
+from errors import ReviewBoardError
+from revgraph import revgraph
+import timings
 
 
 __version__ = '4.1.0'
 
+# the phases of a post reported by --profile-memory, and the spans they are
+# measured by
+MEMORY_PHASES = [('diff', 'diff'), ('fields', 'createfields'),
+                 ('encode', 'encode'), ('upload', 'http')]
+
 
 def postreview(ui, repo, rev='.', **opts):
     '''post a changeset to a Review Board server
@@ -39,22 +52,85 @@ this is not the case.
 The --outgoing option recognizes the path entries 'reviewboard', 'default-push'
 and 'default' in this order of precedence. 'reviewboard' may be used if the
 repository accessible to Review Board is not the upstream repository.
+
+The --rparent-from-phases option (or the reviewboard.rparent_from_phases
+setting) takes the base revision from the phases of the changesets instead of
+asking the upstream repository: the parent of the oldest draft or secret
+ancestor of the revision.  It only falls back to discovery against the
+upstream repository when the phases do not give a single answer, e.g. when
+the revision is public or its unpublished ancestors have several roots.
+
+The --each option posts a separate review request for every changeset in a
+revision set, using the parent of each changeset as the base of its diff.
+The requests are created concurrently; combine it with --existing and a
+comma separated list of request IDs (one per changeset, in revision order)
+to update a stack of existing requests instead.
+
+The diff, parent diff and fields posted to a review request are remembered in
+.hg/reviewboard/posts.json.  When an existing request is updated with a diff
+that has not changed since it was last posted, the upload is skipped, and so
+is the update of its fields if they have not changed either.  Use
+--force-upload to post everything regardless.
+
+The --timings option prints how long each step took, including every request
+to the server.  The same timings are appended as JSON lines to the file named
+by the reviewboard.timings_file setting, if there is one.  --profile-memory
+prints the resident memory of the process after computing the diffs, creating
+the fields, encoding the request bodies and uploading them, and how much each
+of these raised its peak.
+
+--dump-diffs DIR writes the diff and parent diff of each posted changeset to
+files in DIR, named after the changeset, e.g. to look at exactly what was
+uploaded without the rest of the --debug output.
+
+--daemon (or the reviewboard.use_daemon setting) makes the requests to the
+server through a session daemon listening on a Unix socket in the
+reviewboard.cache_dir directory.  The first run starts it with its login;
+later runs for the same server and user use its connections, cookies and
+cached resources instead of logging in again.  The daemon exits after
+reviewboard.daemon_idle_timeout seconds without a request (600 by default).
+--refresh-repos does not use a running daemon but starts a new one.  The
+daemon keeps the login it was started with; after changing the password, or
+when its posts fail to authenticate, stop it with --daemon-stop, which posts
+nothing, and the next --daemon run starts a new one.
 '''
 
+    recorder = None
+    if (opts.get('timings') or opts.get('profile_memory') or
+        ui.config('reviewboard', 'timings_file')):
+        recorder = timings.enable(memory=opts.get('profile_memory'))
+    span = timings.start('postreview')
+    try:
+        return post(ui, repo, rev, opts)
+    finally:
+        span.finish()
+        if recorder is not None:
+            timings.disable()
+            report_timings(ui, recorder, opts)
+
+
+def post(ui, repo, rev, opts):
+    '''do the work of postreview'''
     ui.status('postreview plugin, version %s\n' % __version__)
     
     # checks to see if the server was set
     find_server(ui, opts)
+
+    if opts.get('daemon_stop'):
+        return stopdaemon(ui, opts)
     
     check_parent_options(opts)
 
+    if opts.get('each'):
+        return post_each(ui, repo, opts)
+
     c = repo.changectx(rev)
 
     rparent = find_rparent(ui, repo, c, opts)
-    ui.debug('remote parent: %s\n' % rparent)
+    debug(ui, 'remote parent: %s\n', rparent)
     
     parent  = find_parent(ui, repo, c, rparent, opts)
-    ui.debug('parent: %s\n' % parent)
+    debug(ui, 'parent: %s\n', parent)
 
     if parent is None:
         msg = "Unable to determine parent revision for diff. "
@@ -63,24 +139,173 @@ repository accessible to Review Board is not the upstream repository.
                      "(type 'hg out'). Did you forget to commit ('hg st')?")
         raise util.Abort(msg)
 
-    diff, parentdiff = create_review_data(ui, repo, c, parent, rparent)
+    diff, parentdiff = create_review_data(ui, repo, c, parent, rparent,
+                                          getdiffsink(opts))
 
     send_review(ui, repo, c, parent, diff, parentdiff, opts)
 
 
-def find_rparent(ui, repo, c, opts):
+def report_timings(ui, recorder, opts):
+    '''print the timings of a run and append them to the timings file'''
+    if opts.get('timings'):
+        ui.status(_('\ntimings:\n'))
+        for line in recorder.report():
+            ui.status(line)
+    if opts.get('profile_memory'):
+        ui.status(_('\nmemory:\n'))
+        for line in recorder.memory_report(MEMORY_PHASES):
+            ui.status(line)
+    path = ui.config('reviewboard', 'timings_file')
+    if path:
+        recorder.write(path, run='%d.%d' % (os.getpid(), time.time()),
+                       version=__version__,
+                       user=ui.config('reviewboard', 'user'))
+
+
+def post_each(ui, repo, opts):
+    '''post one review request per changeset in the --each revision set'''
+    revs = list(revrange(repo, [opts['each']]))
+    if not revs:
+        raise util.Abort(_('no changesets in revision set %s') % opts['each'])
+
+    request_ids = [None] * len(revs)
+    if opts['existing']:
+        request_ids = [id.strip() for id in opts['existing'].split(',')]
+        if len(request_ids) != len(revs):
+            raise util.Abort(_('%d request IDs given for %d changesets')
+                             % (len(request_ids), len(revs)))
+
+    # outgoing changesets are the same for the whole stack, only look
+    # for them once
+    out = None
+    if ((opts.get('outgoingrepo') or opts.get('outgoing'))
+        and not usephases(ui, opts)):
+        out = outgoing(ui, repo, opts.get('outgoingrepo'))
+
+    # work out everything locally before the first request is sent, the
+    # diffs of all changesets are computed at once
+    parents = []
+    for rev in revs:
+        c = repo[rev]
+        rparent = find_rparent(ui, repo, c, opts, out)
+        parents.append((c, c.parents()[0], rparent))
+    data = create_reviews_data(ui, repo, parents, getdiffsink(opts))
+
+    from poststate import post_digests
+    state = getpoststate(ui, repo, opts)
+    reviews = []
+    digests = []
+    for (c, parent, rparent), (diff, parentdiff), request_id \
+            in zip(parents, data, request_ids):
+        revopts = dict(opts, existing=request_id)
+        fields = createfields(ui, repo, c, parent, revopts)
+        digests.append(post_digests(fields, diff, parentdiff))
+        if request_id:
+            fields, diff, parentdiff = skip_unchanged(ui, state, request_id,
+                                                      digests[-1], fields,
+                                                      diff, parentdiff, opts)
+        reviews.append((c, request_id, fields, diff, parentdiff))
+
+    reviewboard = getreviewboard(ui, opts)
+    repo_id = None
+    if None in request_ids:
+        repo_id = find_reviewboard_repo_id(ui, reviewboard, opts)
+
+    from workers import WorkerPool
+    pool = WorkerPool(ui.configint('reviewboard', 'batch_workers', 4))
+    try:
+        jobs = [pool.submit(post_request, reviewboard, repo_id, request_id,
+                            fields, diff, parentdiff, opts['publish'])
+                for c, request_id, fields, diff, parentdiff in reviews]
+        for job in jobs:
+            job.wait()
+    finally:
+        pool.shutdown()
+
+    server = find_server(ui, opts)
+    if not server.startswith('http'):
+        server = 'http://%s' % server
+    failed = 0
+    ui.status('\n%6s  %-12s  %8s  %8s  %s\n'
+              % ('rev', 'changeset', 'request', 'seconds', 'url'))
+    for (c, request_id, fields, diff, parentdiff), job, revdigests \
+            in zip(reviews, jobs, digests):
+        try:
+            request_id = job.result()
+            state.record(request_id, revdigests)
+            url = '%s/r/%s/' % (server.rstrip('/'), request_id)
+        except (ReviewBoardError, util.Abort, EnvironmentError), msg:
+            failed += 1
+            request_id = request_id or '-'
+            url = 'error: %s' % unicode(msg)
+        ui.status('%6d  %-12s  %8s  %8.2f  %s\n'
+                  % (c.rev(), c, request_id, job.elapsed, url))
+
+    if failed:
+        raise util.Abort(_('%d of %d review requests could not be posted')
+                         % (failed, len(jobs)))
+
+
+def post_request(reviewboard, repo_id, request_id, fields, diff, parentdiff,
+                 publish):
+    '''create or update a review request, return its ID'''
+    if request_id:
+        # nothing is left to update when the request is unchanged
+        if fields or diff or publish:
+            reviewboard.update_request(request_id, fields, diff, parentdiff,
+                                       publish=publish)
+    else:
+        request_id = reviewboard.new_request(repo_id, fields, diff, parentdiff,
+                                             publish=publish)
+    return request_id
+
+
+def revrange(repo, revs):
+    try:
+        # hg >= 1.9
+        from mercurial import scmutil
+        return scmutil.revrange(repo, revs)
+    except (ImportError, AttributeError):
+        return cmdutil.revrange(repo, revs)
+
+
+@timings.timed('find_rparent')
+def find_rparent(ui, repo, c, opts, out=None):
     outgoing = opts.get('outgoing')
     outgoingrepo = opts.get('outgoingrepo')
     master = opts.get('master')
 
+    rparent = None
     if master:
         rparent = repo[master]
-    elif outgoingrepo:
-        rparent = remoteparent(ui, repo, c, upstream=outgoingrepo)
-    elif outgoing:
-        rparent = remoteparent(ui, repo, c)
-    else:
-        rparent = None
+    elif outgoingrepo or outgoing or opts.get('rparent_from_phases'):
+        if usephases(ui, opts):
+            rparent = phaseparent(ui, repo, c)
+        if rparent is None:
+            rparent = remoteparent(ui, repo, c, upstream=outgoingrepo,
+                                   out=out)
+    return rparent
+
+
+def usephases(ui, opts):
+    return (opts.get('rparent_from_phases') or
+            ui.configbool('reviewboard', 'rparent_from_phases'))
+
+
+def phaseparent(ui, repo, ctx):
+    '''return the parent of the unpublished ancestors of ctx, or None if the
+phases do not tell'''
+    try:
+        roots = list(revrange(repo, ['roots((::%d) - public())' % ctx.rev()]))
+    except error.ParseError:
+        # hg < 2.1 has no phases
+        return None
+    if len(roots) != 1:
+        debug(ui, '%d roots of unpublished changesets, phases are ambiguous\n',
+              len(roots))
+        return None
+    rparent = repo[roots[0]].parents()[0]
+    debug(ui, 'remote parent from phases: %s\n', rparent)
     return rparent
 
 
@@ -100,36 +325,78 @@ def find_parent(ui, repo, c, rparent, opts):
     return parent
 
 
-def create_review_data(ui, repo, c, parent, rparent):
+def create_review_data(ui, repo, c, parent, rparent, sink=None):
     'Returns a tuple of the diff and parent diff for the review.'
-    diff = getdiff(ui, repo, c, parent)
-    ui.debug('\n=== Diff from parent to rev ===\n')
-    ui.debug(diff + '\n')
-
-    if rparent != None and parent != rparent:
-        parentdiff = getdiff(ui, repo, parent, rparent)
-        ui.debug('\n=== Diff from rparent to parent ===\n')
-        ui.debug(parentdiff + '\n')
-    else:
-        parentdiff = ''
-    return diff, parentdiff
+    return create_reviews_data(ui, repo, [(c, parent, rparent)], sink)[0]
+
+
+@timings.timed('diff')
+def create_reviews_data(ui, repo, reviews, sink=None):
+    '''Returns a list with a tuple of the diff and parent diff for each of
+    the (rev, parent, remote parent) tuples in reviews.  The diffs are also
+    written to sink, a DiffSink, if there is one.'''
+    pairs = []
+    for c, parent, rparent in reviews:
+        pairs.append((c, parent))
+        if rparent != None and parent != rparent:
+            pairs.append((parent, rparent))
+    diffs = getdiffs(ui, repo, pairs)
+    difffilter = getdifffilter(ui)
+
+    data = []
+    for c, parent, rparent in reviews:
+        diff = diffs.pop(0)
+        omitted = []
+        if difffilter is not None:
+            diff, omitted = filterdiff(ui, difffilter, diff)
+        debug(ui, '\n=== Diff from parent to rev ===\n')
+        debugdiff(ui, diff)
+        dumpdiff(ui, sink, '%s.diff' % c, diff)
+
+        if rparent != None and parent != rparent:
+            parentdiff = diffs.pop(0)
+            if difffilter is not None:
+                parentdiff = filterparentdiff(ui, difffilter, parentdiff,
+                                              omitted)
+            debug(ui, '\n=== Diff from rparent to parent ===\n')
+            debugdiff(ui, parentdiff)
+            dumpdiff(ui, sink, '%s.parent.diff' % c, parentdiff)
+        else:
+            parentdiff = ''
+        data.append((diff, parentdiff))
+    return data
     
     
 def send_review(ui, repo, c, parentc, diff, parentdiff, opts):
+    from poststate import post_digests
     reviewboard = getreviewboard(ui, opts)
     fields = createfields(ui, repo, c, parentc, opts)
 
+    state = getpoststate(ui, repo, opts)
+    digests = post_digests(fields, diff, parentdiff)
+
     request_id = opts['existing']
     if request_id:
-        update_review(request_id, ui, reviewboard, fields, diff, parentdiff, opts)
+        fields, diff, parentdiff = skip_unchanged(ui, state, request_id,
+                                                  digests, fields, diff,
+                                                  parentdiff, opts)
+        if fields or diff or opts['publish']:
+            update_review(request_id, ui, reviewboard, fields, diff,
+                          parentdiff, opts)
     else:
         request_id = new_review(ui, reviewboard, fields, diff, parentdiff, opts)
+    state.record(request_id, digests)
 
     request_url = '%s/%s/%s/' % (find_server(ui, opts), "r", request_id)
 
     if not request_url.startswith('http'):
         request_url = 'http://%s' % request_url
 
+    if not (fields or diff or opts['publish']):
+        ui.status('\nreview request unchanged, nothing posted: %s\n'
+                  % request_url)
+        return
+
     msg = '\nreview request draft saved: %s\n'
     if opts['publish']:
         msg = '\nreview request published: %s\n'
@@ -139,6 +406,35 @@ def send_review(ui, repo, c, parentc, diff, parentdiff, opts):
         launch_webbrowser(ui, request_url)
 
 
+def getpoststate(ui, repo, opts):
+    '''return the record of what was last posted to each review request'''
+    from poststate import PostState
+    return PostState(repo.join('reviewboard/posts.json'),
+                     find_server(ui, opts))
+
+
+def skip_unchanged(ui, state, request_id, digests, fields, diff, parentdiff,
+                   opts):
+    '''drop the parts of an update that request_id already has
+
+Returns the fields, diff and parent diff that still need to be posted.  The
+diff is only skipped when the parent diff is unchanged as well, because the
+two are uploaded together.'''
+    if opts.get('force_upload'):
+        return fields, diff, parentdiff
+    posted = state.get(request_id)
+    if (posted.get('diff') == digests['diff'] and
+        posted.get('parentdiff') == digests['parentdiff']):
+        ui.status(_('review request %s: diff unchanged since the last '
+                    'post, skipping the upload\n') % request_id)
+        diff, parentdiff = '', ''
+        if fields and posted.get('fields') == digests['fields']:
+            ui.status(_('review request %s: fields unchanged since the last '
+                        'post, skipping the update\n') % request_id)
+            fields = {}
+    return fields, diff, parentdiff
+
+
 def launch_webbrowser(ui, request_url):
     # not all python installations have this module, so only import it
     # when it's used
@@ -151,12 +447,162 @@ def launch_webbrowser(ui, request_url):
     webbrowser.open(request_url)
 
 
+def iterdiff(repo, r, parent):
+    '''yield the chunks of the diff for the specified revision'''
+    return patch.diff(repo, parent.node(), r.node())
+
+
+@timings.timed('getdiff')
 def getdiff(ui, repo, r, parent):
-    '''return diff for the specified revision'''
-    output = ""
-    for chunk in patch.diff(repo, parent.node(), r.node()):
-        output += chunk
-    return output
+    '''return diff for the specified revision
+
+The diff is returned as a DiffBuffer, which moves its contents to a
+temporary file once they grow beyond the reviewboard.diff_spool_size
+setting.'''
+    from diffbuffer import DEFAULT_SPOOL_SIZE, spooldiff
+    spool_size = ui.configint('reviewboard', 'diff_spool_size',
+                              DEFAULT_SPOOL_SIZE)
+    return spooldiff(iterdiff(repo, r, parent), spool_size)
+
+
+@timings.timed('getdiffs')
+def getdiffs(ui, repo, pairs):
+    '''return the diffs for a list of (revision, parent) pairs
+
+Diffs computed before are taken from the cache returned by getdiffcache.  The
+others are computed file by file in up to reviewboard.diff_workers
+processes, by default one per CPU, if the changed files come to at least
+reviewboard.diff_pool_min_size bytes; smaller changes are diffed faster than
+the processes start.'''
+    from diffbuffer import DEFAULT_SPOOL_SIZE
+    from diffpool import DEFAULT_MIN_SIZE, DiffPool
+    spool_size = ui.configint('reviewboard', 'diff_spool_size',
+                              DEFAULT_SPOOL_SIZE)
+    cache = getdiffcache(ui, repo)
+    diffs = [None] * len(pairs)
+    if cache is not None:
+        options = diffoptions(repo)
+        keys = [cache.key(parent.node(), r.node(), options)
+                for r, parent in pairs]
+        diffs = [cache.get(key, spool_size) for key in keys]
+    missing = [i for i, diff in enumerate(diffs) if diff is None]
+
+    # 0 for one per CPU, counted only if the pool is started
+    workers = ui.configint('reviewboard', 'diff_workers', 0)
+    if workers == 1:
+        computed = [getdiff(ui, repo, pairs[i][0], pairs[i][1])
+                    for i in missing]
+    else:
+        pool = DiffPool(workers,
+                        min_size=ui.configint('reviewboard',
+                                              'diff_pool_min_size',
+                                              DEFAULT_MIN_SIZE))
+        computed = pool.diffs(repo, [(pairs[i][1].node(), pairs[i][0].node())
+                                     for i in missing], spool_size)
+
+    for i, diff in zip(missing, computed):
+        diffs[i] = diff
+        if cache is not None:
+            cache.put(keys[i], diff)
+    if cache is not None:
+        debug(ui, 'diff cache: %d hits, %d misses\n', cache.hits,
+              cache.misses)
+    return diffs
+
+
+def getdiffcache(ui, repo):
+    '''return the cache of computed diffs, or None if it is disabled'''
+    if not ui.configbool('reviewboard', 'diff_cache', True):
+        return None
+    from diffcache import DEFAULT_CACHE_SIZE, DiffCache
+    path = ui.config('reviewboard', 'diff_cache_dir')
+    if path:
+        path = os.path.expanduser(path)
+    else:
+        path = repo.join('cache/reviewboard/diffs')
+    size = ui.configint('reviewboard', 'diff_cache_size', DEFAULT_CACHE_SIZE)
+    return DiffCache(path, size)
+
+
+def diffoptions(repo):
+    '''return the settings that change the text of a diff'''
+    return [('quiet', bool(repo.ui.quiet)),
+            ('debugflag', bool(repo.ui.debugflag))]
+
+
+def getdifffilter(ui):
+    '''return the filter that leaves files out of the posted diffs, or None if
+no files are to be left out
+
+Files matching one of the reviewboard.diff_exclude globs and files whose part
+of the diff is larger than reviewboard.diff_max_file_size bytes are replaced
+with a note that they have changed.'''
+    excludes = ui.configlist('reviewboard', 'diff_exclude')
+    maxsize = ui.configint('reviewboard', 'diff_max_file_size', 0)
+    if not (excludes or maxsize):
+        return None
+    from diffbuffer import DEFAULT_SPOOL_SIZE
+    from difffilter import DiffFilter
+    spool_size = ui.configint('reviewboard', 'diff_spool_size',
+                              DEFAULT_SPOOL_SIZE)
+    return DiffFilter(excludes, maxsize, spool_size)
+
+
+def filterdiff(ui, difffilter, diff):
+    '''return the filtered diff and the files that were left out of it'''
+    from diffbuffer import spooldiff
+    difffilter.omitted = []
+    diff = spooldiff(difffilter.filter(diff), difffilter.spool_size)
+    for path, reason in difffilter.omitted:
+        ui.status(_('%s: %s, left out of the diff\n') % (path, reason))
+    return diff, [path for path, reason in difffilter.omitted]
+
+
+def filterparentdiff(ui, difffilter, parentdiff, omitted):
+    '''return the filtered parent diff
+
+Review Board applies the diff on top of the parent diff, so only the files
+matching the exclude globs and the files left out of the diff are left out of
+the parent diff; a file whose change is in the diff keeps its change in the
+parent diff, however large.'''
+    from diffbuffer import spooldiff
+    from difffilter import DiffFilter
+    parentfilter = DiffFilter(difffilter.excludes,
+                              spool_size=difffilter.spool_size)
+    parentdiff = spooldiff(parentfilter.filter(parentdiff, set(omitted)),
+                           difffilter.spool_size)
+    for path, reason in parentfilter.omitted:
+        debug(ui, '%s: %s, left out of the parent diff\n', path, reason)
+    return parentdiff
+
+
+def debugdiff(ui, diff):
+    '''write a diff to the debug output one chunk at a time'''
+    if not ui.debugflag:
+        return
+    for chunk in diff:
+        ui.debug(chunk)
+    ui.debug('\n')
+
+
+def getdiffsink(opts):
+    '''return the DiffSink writing to the --dump-diffs directory, or None'''
+    directory = opts.get('dump_diffs')
+    if not directory:
+        return None
+    return DiffSink(os.path.expanduser(directory))
+
+
+def dumpdiff(ui, sink, name, diff):
+    '''write a diff to the file name of sink, if there is a sink'''
+    if sink is None:
+        return
+    try:
+        path = sink.dump(name, diff)
+    except (IOError, OSError), e:
+        raise util.Abort(_('cannot dump the diff to %s: %s')
+                         % (sink.directory, e.strerror or e))
+    ui.status(_('diff written to %s\n') % path)
 
 
 def getreviewboard(ui, opts):
@@ -185,17 +631,115 @@ def getreviewboard(ui, opts):
     if apiver:
         ui.status('apiver: %s\n' % apiver)
 
+    usedaemon = (opts.get('daemon') or
+                 ui.configbool('reviewboard', 'use_daemon'))
+    if usedaemon and not opts.get('refresh_repos'):
+        client = connectdaemon(ui, server, username)
+        if client is not None:
+            return client
+
+    cache = getcache(ui, server)
+    if cache is not None and opts.get('refresh_repos'):
+        cache.invalidate('repositories')
+
     try:
-        return make_rbclient(server, username, password, proxy=proxy, apiver=apiver)
+        client = make_rbclient(server, username, password, proxy=proxy,
+                               apiver=apiver, cache=cache,
+                               compress_uploads=ui.configbool('reviewboard',
+                                   'compress_uploads'), ui=ui)
     except ReviewBoardError, msg:
         raise util.Abort(_(unicode(msg)))
+    client.prefetch = ui.configbool('reviewboard', 'prefetch_pages')
+    client.overlap_draft = ui.configbool('reviewboard', 'overlap_draft')
+    if usedaemon:
+        client = startdaemon(ui, client, server, username)
+    return client
+
+
+def daemonsocket(ui, server, username):
+    '''return the path of the socket of the session daemon for server'''
+    from reviewboard import default_cache_dir
+    import daemon
+    cachedir = ui.config('reviewboard', 'cache_dir') or default_cache_dir()
+    return daemon.socket_path(os.path.expanduser(cachedir), server, username)
+
+
+def connectdaemon(ui, server, username):
+    '''return a client for the running session daemon for server, or None'''
+    import daemon
+    if not daemon.supported():
+        return None
+    path = daemonsocket(ui, server, username)
+    client = daemon.connect(path)
+    if client is not None:
+        ui.status(_('using the session daemon at %s\n') % path)
+    return client
+
+
+def stopdaemon(ui, opts):
+    '''stop the session daemon for the server and user, if one is running'''
+    import daemon
+    server = find_server(ui, opts)
+    username = opts.get('username') or ui.config('reviewboard', 'user')
+    client = None
+    if daemon.supported():
+        client = daemon.connect(daemonsocket(ui, server, username))
+    if client is None:
+        ui.status(_('no session daemon is running for %s\n') % server)
+        return
+    try:
+        client.stop()
+    except ReviewBoardError, msg:
+        raise util.Abort(_(unicode(msg)))
+    ui.status(_('stopped the session daemon at %s\n') % client.path)
+
+
+def startdaemon(ui, client, server, username):
+    '''start a session daemon making the API calls with client
+
+Returns a client for the daemon, or client itself where there is no daemon
+support.'''
+    import daemon
+    if not daemon.supported():
+        ui.warn(_('no session daemon on this platform\n'))
+        return client
+    path = daemonsocket(ui, server, username)
+    timeout = ui.configint('reviewboard', 'daemon_idle_timeout',
+                           daemon.DEFAULT_IDLE_TIMEOUT)
+    try:
+        client = daemon.start(client, path, timeout)
+    except (IOError, OSError), e:
+        ui.warn(_('cannot start the session daemon at %s: %s\n')
+                % (path, e))
+        return client
+    ui.status(_('started a session daemon at %s\n') % path)
+    return client
+
+
+def make_rbclient(*args, **kwargs):
+    '''create the Review Board API client, see reviewboard.make_rbclient
+
+The reviewboard module, and the HTTP and JSON modules it uses, are only
+imported here.'''
+    from reviewboard import make_rbclient
+    return make_rbclient(*args, **kwargs)
+
+
+def getcache(ui, server):
+    '''return the on-disk cache for API responses from server, or None if
+    caching is disabled'''
+    if not ui.configbool('reviewboard', 'cache', True):
+        return None
+    from reviewboard import DEFAULT_CACHE_TTL, ResourceCache, default_cache_dir
+    cachedir = ui.config('reviewboard', 'cache_dir') or default_cache_dir()
+    ttl = ui.configint('reviewboard', 'cache_ttl', DEFAULT_CACHE_TTL)
+    return ResourceCache(os.path.expanduser(cachedir), server, ttl)
 
 
 def update_review(request_id, ui, reviewboard, fields, diff, parentdiff, opts):
     try:
-        reviewboard.update_request(request_id, fields, diff, parentdiff)
-        if opts['publish']:
-            reviewboard.publish(request_id)
+        reviewboard.update_request(request_id, fields, diff, parentdiff,
+                                   publish=opts['publish'])
     except ReviewBoardError, msg:
         raise util.Abort(_(unicode(msg)))
 
@@ -203,9 +747,8 @@ def update_review(request_id, ui, reviewboard, fields, diff, parentdiff, opts):
 def new_review(ui, reviewboard, fields, diff, parentdiff, opts):
     repo_id = find_reviewboard_repo_id(ui, reviewboard, opts)
     try:
-        request_id = reviewboard.new_request(repo_id, fields, diff, parentdiff)
-        if opts['publish']:
-            reviewboard.publish(request_id)
+        request_id = reviewboard.new_request(repo_id, fields, diff, parentdiff,
+                                             publish=opts['publish'])
     except ReviewBoardError, msg:
         raise util.Abort(_(unicode(msg)))
 
@@ -219,42 +762,41 @@ def find_reviewboard_repo_id(ui, reviewboard, opts):
         return ui.config('reviewboard','repoid')
 
     try:
+        # repositories are fetched lazily and looked up by their
+        # canonical path, the listing stops at the first match
+        r = reviewboard.find_repository(expandpath(ui, opts['outgoingrepo']))
+        if r is not None:
+            ui.status('Using repository: %s\n' % r.name)
+            return str(r.id)
+
         repositories = reviewboard.repositories()
+        repositories = sorted(repositories, key=operator.attrgetter('name'),
+                              cmp=lambda x, y: cmp(x.lower(), y.lower()))
     except ReviewBoardError, msg:
         raise util.Abort(_(unicode(msg)))
 
     if not repositories:
-        raise util.Abort(_('no repositories configured at %s' % server))
+        raise util.Abort(_('no repositories configured at %s')
+                         % find_server(ui, opts))
 
-    repositories = sorted(repositories, key=operator.attrgetter('name'),
-                          cmp=lambda x, y: cmp(x.lower(), y.lower()))
-    
-    remotepath = expandpath(ui, opts['outgoingrepo']).lower()
-    repo_id = None
+    ui.status('Repositories:\n')
+    repo_ids = set()
     for r in repositories:
         if r.tool != 'Mercurial':
             continue
-        if r.path.lower() == remotepath:
-            repo_id = str(r.id)
-            ui.status('Using repository: %s\n' % r.name)
-    if repo_id == None:
-        ui.status('Repositories:\n')
-        repo_ids = set()
-        for r in repositories:
-            if r.tool != 'Mercurial':
-                continue
-            ui.status('[%s] %s\n' % (r.id, r.name) )
-            repo_ids.add(str(r.id))
-        if len(repositories) > 1:
-            repo_id = ui.prompt('repository id:', 0)
-            if not repo_id in repo_ids:
-                raise util.Abort(_('invalid repository ID: %s') % repo_id)
-        else:
-            repo_id = str(repositories[0].id)
-            ui.status('repository id: %s\n' % repo_id)
+        ui.status('[%s] %s\n' % (r.id, r.name) )
+        repo_ids.add(str(r.id))
+    if len(repositories) > 1:
+        repo_id = ui.prompt('repository id:', 0)
+        if not repo_id in repo_ids:
+            raise util.Abort(_('invalid repository ID: %s') % repo_id)
+    else:
+        repo_id = str(repositories[0].id)
+        ui.status('repository id: %s\n' % repo_id)
     return repo_id
 
 
+@timings.timed('createfields')
 def createfields(ui, repo, c, parentc, opts):
     fields = {}
     
@@ -319,7 +861,17 @@ def createfields(ui, repo, c, parentc, opts):
     return fields
 
 
-def remoteparent(ui, repo, ctx, upstream=None):
+def remoteparent(ui, repo, ctx, upstream=None, out=None):
+    if out is None:
+        out = outgoing(ui, repo, upstream)
+    
+    rev = revgraph(repo).remoteparent(ctx.rev(),
+                                      [repo.changelog.rev(o) for o in out])
+    if rev is not None:
+        return repo[rev]
+
+
+def remoterepository(ui, repo, upstream=None):
     remotepath = expandpath(ui, upstream)
     if hasattr(localrepo, 'localpeer'):
         # hg >= 2.3
@@ -330,17 +882,60 @@ def remoteparent(ui, repo, ctx, upstream=None):
     else:
         # hg < 2.3
         remoterepo = hg.repository(ui, remotepath)
-    
+    return remoterepo
+
+
+@timings.timed('outgoing')
+def outgoing(ui, repo, upstream=None):
+    '''return the changesets missing from the upstream repository
+
+Full discovery is only run when the upstream or the local repository has
+new heads since the last time.  Otherwise the common heads found then,
+which are kept in .hg/cache/reviewboard/discovery.json, are used to work out
+the outgoing changesets locally.'''
+    remotepath = expandpath(ui, upstream)
+    remoterepo = remoterepository(ui, repo, upstream)
+    changelog = repo.changelog
+    if not hasattr(changelog, 'findmissing'):
+        # hg < 1.9
+        return findoutgoing(repo, remoterepo)
+
+    remoteheads = remoterepo.heads()
+    nodemap = changelog.nodemap
+    if not [h for h in remoteheads if h not in nodemap]:
+        # everything upstream is here as well, no discovery needed
+        ui.debug('all remote heads known locally\n')
+        return changelog.findmissing(common=remoteheads)
+
+    cache = None
+    if ui.configbool('reviewboard', 'cache', True):
+        from poststate import DiscoveryCache
+        cache = DiscoveryCache(repo.join('cache/reviewboard/discovery.json'))
+        remotehex = [hex(h) for h in remoteheads]
+        localhex = [hex(h) for h in repo.heads()]
+        common = cache.common(remotepath, remotehex, localhex)
+        if common is not None and not [h for h in common
+                                       if bin(h) not in nodemap]:
+            ui.debug('remote unchanged, using the last discovery result\n')
+            return changelog.findmissing(common=[bin(h) for h in common])
+
     out = findoutgoing(repo, remoterepo)
-    
-    for o in out:
-        orev = repo[o]
-        a, b, c = repo.changelog.nodesbetween([orev.node()], [ctx.node()])
-        if a:
-            return orev.parents()[0]
+    if cache is not None:
+        missing = set([changelog.rev(n) for n in out])
+        common = revgraph(repo).heads([r for r in repo if r not in missing])
+        cache.record(remotepath, remotehex, localhex,
+                     [hex(changelog.node(r)) for r in common] or
+                     [hex(changelog.node(nullrev))])
+    return out
 
 
+@timings.timed('findoutgoing')
 def findoutgoing(repo, remoterepo):
+    if not hasattr(remoterepo, 'capable') and hasattr(remoterepo, 'peer'):
+        # hg >= 2.3 runs discovery against a peer, not against the
+        # repository remoterepository() unwraps for a local path
+        remoterepo = remoterepo.peer()
+
     # The method for doing this has changed a few times...
     try:
         from mercurial import discovery
@@ -377,39 +972,33 @@ def check_parent_options(opts):
         raise util.Abort(_(
            "you cannot combine the --parent, --outgoingchanges "
            "and --branch options"))
+
+    if opts.get('each') and (usep or useg or useb):
+        raise util.Abort(_(
+           "the --each option cannot be combined with the --parent, "
+           "--outgoingchanges or --branch options"))
            
-    if useg and not (opts.get('outgoing') or opts.get('outgoingrepo')):
+    if useg and not (opts.get('outgoing') or opts.get('outgoingrepo') or
+                     opts.get('rparent_from_phases')):
         msg = ("When using the -g/--outgoingchanges flag, you must also use "
-            "either the -o or the -O <repo> flag.")
+            "either the -o, the -O <repo> or the --rparent-from-phases flag.")
         raise util.Abort(msg)
 
 
 def find_branch_parent(ui, ctx):
     '''Find the parent revision of the 'ctx' branch.'''
-    branchname = ctx.branch()
-    
-    getparent = lambda ctx: ctx.parents()[0]
-    
-    currctx = ctx
-    while getparent(currctx) and currctx.branch() == branchname:
-        currctx = getparent(currctx)
-        ui.debug('currctx rev: %s; branch: %s\n' % (currctx.rev(), 
-                                            currctx.branch()))
-                                            
-    # return the root of the repository if the first
-    # revision is on the branch
-    if not getparent(currctx) and currctx.branch() == branchname:
-        return currctx._repo['000000000000']
-    
-    return currctx
+    # the root of the repository if the first revision is on the branch
+    rev = revgraph(ctx._repo).branch_root(ctx.rev())
+    debug(ui, 'branch parent rev: %s\n', rev)
+    return ctx._repo[rev]
 
 
 def find_contexts(repo, parentctx, ctx, opts):
     """Find all context between the contexts, excluding the parent context."""
     contexts = []
-    for node in repo.changelog.nodesbetween([parentctx.node()],[ctx.node()])[0]:
-        currctx = repo[node]
-        if node == parentctx.node():
+    for rev in revgraph(repo).between(parentctx.rev(), ctx.rev()):
+        currctx = repo[rev]
+        if rev == parentctx.rev():
             continue
         # only show nodes on the current branch
         if opts['branch'] and currctx.branch() != ctx.branch():
@@ -467,6 +1056,26 @@ cmdtable = {
         ('', 'username', '', _('username for the ReviewBoard site')),
         ('', 'password', '', _('password for the ReviewBoard site')),
         ('', 'apiver', '', _('ReviewBoard API version (e.g. 1.0, 2.0)')),
+        ('', 'each', '',
+         _('post a separate review request for each changeset in REVSET')),
+        ('', 'refresh-repos', False,
+         _('fetch the list of repositories again instead of using the cache')),
+        ('', 'rparent-from-phases', False,
+         _('use the phases to determine the parent diff base')),
+        ('', 'force-upload', False,
+         _('upload the diff even if it has not changed since the last post')),
+        ('', 'timings', False,
+         _('print how long each step and each server request took')),
+        ('', 'profile-memory', False,
+         _('print the memory used by each phase of the post')),
+        ('', 'dump-diffs', '',
+         _('write the posted diffs to files in DIR'), _('DIR')),
+        ('', 'daemon', False,
+         _('make the server requests through a session daemon, which keeps '
+           'the login and connections for the next runs')),
+        ('', 'daemon-stop', False,
+         _('stop the session daemon for the server and user, to log in '
+           'again with the next --daemon run')),
         ],
         _('hg postreview [OPTION]... [REVISION]')),
 }
@@ -0,0 +1,79 @@
+# runs review board API calls concurrently for tools built on the
+# reviewboard extension
+
+import threading
+
+from workers import WorkerPool
+
+# threads the API calls are submitted to
+DEFAULT_WORKERS = 8
+
+# API calls running at once, which bounds the connections they open
+DEFAULT_MAX_CALLS = 4
+
+class AsyncApiClient:
+    """
+    Wraps an Api20Client or Api10Client so that its calls run on a
+    WorkerPool of at most workers threads.  Every method returns a Job at
+    once; its result method waits for the call and returns what the client
+    returned, or raises what it raised.  Lists are returned complete rather
+    than as a PagedList.
+
+    At most maxcalls of the calls run at once, so that they do not open
+    more connections to the server than that; the others queue until one
+    is done.  The connection pool of the client is left as it is.
+    """
+    def __init__(self, client, workers=DEFAULT_WORKERS,
+                 maxcalls=DEFAULT_MAX_CALLS):
+        self.client = client
+        self._calls = threading.BoundedSemaphore(maxcalls or workers)
+        self._pool = WorkerPool(workers)
+        # the lists are fetched into the client a page at a time, one
+        # listing of each at a time
+        self._listlock = threading.Lock()
+
+    def repositories(self):
+        return self._submit(self._list, self.client.repositories)
+
+    def pending_user_requests(self):
+        return self._submit(self._list, self.client.pending_user_requests)
+
+    def new_request(self, repo_id, fields={}, diff='', parentdiff='',
+                    publish=False):
+        return self._submit(self.client.new_request, repo_id, fields, diff,
+                            parentdiff, publish)
+
+    def update_request(self, id, fields={}, diff='', parentdiff='',
+                       publish=False):
+        return self._submit(self.client.update_request, id, fields, diff,
+                            parentdiff, publish)
+
+    def publish(self, id):
+        return self._submit(self.client.publish, id)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait)
+
+    def _submit(self, fn, *args):
+        return self._pool.submit(self._call, fn, *args)
+
+    def _call(self, fn, *args):
+        self._calls.acquire()
+        try:
+            return fn(*args)
+        finally:
+            self._calls.release()
+
+    def _list(self, fn):
+        self._listlock.acquire()
+        try:
+            return list(fn())
+        finally:
+            self._listlock.release()
+
+
+def results(jobs):
+    """
+    Waits for all the jobs and returns their results in the same order.
+    """
+    return [job.result() for job in jobs]
@@ -0,0 +1,369 @@
+# session daemon keeping a logged in API client for postreview --daemon
+
+import errno
+import hashlib
+import json
+import os
+import select
+import socket
+import threading
+
+import timings
+from diffbuffer import BLOCK_SIZE, DEFAULT_SPOOL_SIZE, DiffBuffer
+from errors import ReviewBoardError
+from reviewboard import Repository
+
+# seconds the daemon waits for a request before it exits
+DEFAULT_IDLE_TIMEOUT = 600
+
+# the API calls the daemon makes on behalf of postreview
+METHODS = ['repositories', 'find_repository', 'new_request',
+           'update_request', 'publish']
+
+def supported():
+    """
+    Returns whether the platform has the Unix sockets and fork the daemon
+    needs.
+    """
+    return hasattr(socket, 'AF_UNIX') and hasattr(os, 'fork')
+
+def socket_path(directory, server, username):
+    """
+    Returns the path of the socket of the daemon for username at server in
+    directory.  Each server and user has a daemon of its own.
+    """
+    key = hashlib.sha1('%s\0%s' % (server, username or '')).hexdigest()
+    return os.path.join(directory, 'daemon-%s.sock' % key[:12])
+
+def connect(path):
+    """
+    Returns a DaemonClient for the daemon listening at path, or None if no
+    daemon is running there.  The socket of a daemon that died is removed.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error, e:
+        sock.close()
+        if e.args[0] == errno.ECONNREFUSED:
+            _unlink(path)
+        elif e.args[0] != errno.ENOENT:
+            raise
+        return None
+    sock.close()
+    return DaemonClient(path)
+
+def start(client, path, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """
+    Starts a daemon making the API calls with client, listening at path
+    until it has had no requests for idle_timeout seconds, and returns a
+    DaemonClient for it.
+
+    The daemon is a fork of the calling process, so client keeps its
+    connections, cookies and cached resources; the caller must not use it
+    afterwards.
+    """
+    listener = listen(path)
+    pid = os.fork()
+    if pid:
+        # connections made before the daemon accepts them wait in the
+        # backlog of the listening socket
+        listener.close()
+        os.waitpid(pid, 0)
+        return DaemonClient(path)
+
+    # detach from the terminal and the hg process
+    try:
+        os.setsid()
+        if os.fork():
+            os._exit(0)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in range(3):
+            os.dup2(devnull, fd)
+        timings.disable()
+        SessionServer(client, listener, path, idle_timeout).serve()
+    finally:
+        os._exit(0)
+
+def listen(path):
+    """
+    Returns a socket listening at path, replacing what was there, which
+    only the user may connect to.
+    """
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, 0700)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            raise
+    _unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0077)
+    try:
+        listener.bind(path)
+    finally:
+        os.umask(umask)
+    listener.listen(16)
+    return listener
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
+
+def _send(sock, message, blobs=()):
+    # a message is a line of JSON followed by the bytes of its blobs, whose
+    # sizes it lists
+    message = dict(message, blobs=[len(blob) for blob in blobs])
+    sock.sendall(json.dumps(message) + '\n')
+    for blob in blobs:
+        if not len(blob):
+            # nothing to send, and the daemon may already have answered
+            continue
+        if isinstance(blob, str):
+            sock.sendall(blob)
+        else:
+            for chunk in blob:
+                sock.sendall(chunk)
+
+def _receive(fp, spool_size=DEFAULT_SPOOL_SIZE):
+    line = fp.readline()
+    if not line:
+        raise EOFError
+    message = json.loads(line)
+    blobs = []
+    for size in message.pop('blobs', []):
+        blob = DiffBuffer(spool_size)
+        while size:
+            data = fp.read(min(size, BLOCK_SIZE))
+            if not data:
+                raise EOFError
+            blob.write(data)
+            size -= len(data)
+        blobs.append(blob)
+    return message, blobs
+
+def _encode(value):
+    # the fields are byte strings in the encoding of the repository, which
+    # go through JSON unchanged as latin-1
+    if isinstance(value, str):
+        return value.decode('latin-1')
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if isinstance(value, dict):
+        return dict([(_encode(k), _encode(v)) for k, v in value.items()])
+    return value
+
+def _decode(value):
+    if isinstance(value, unicode):
+        return value.encode('latin-1')
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if isinstance(value, dict):
+        return dict([(_decode(k), _decode(v)) for k, v in value.items()])
+    return value
+
+def _repository(data):
+    if data is None:
+        return None
+    return Repository(data['id'], data['name'], data['tool'], data['path'])
+
+class DaemonClient:
+    """
+    Stands in for an Api20Client or Api10Client and has the session
+    daemon at path make its calls.  Every call is a connection of its own,
+    so calls may be made from several threads at once.  Errors are raised
+    as ReviewBoardError.
+    """
+    prefetch = False
+
+    def __init__(self, path):
+        self.path = path
+
+    def repositories(self):
+        return [_repository(r) for r in self._call('repositories')]
+
+    def find_repository(self, path):
+        return _repository(self._call('find_repository', path))
+
+    def new_request(self, repo_id, fields={}, diff='', parentdiff='',
+                    publish=False):
+        return self._call('new_request', repo_id, fields, publish=publish,
+                          blobs=(diff, parentdiff))
+
+    def update_request(self, id, fields={}, diff='', parentdiff='',
+                       publish=False):
+        self._call('update_request', id, fields, publish=publish,
+                   blobs=(diff, parentdiff))
+
+    def publish(self, id):
+        self._call('publish', id)
+
+    def stop(self):
+        """
+        Makes the daemon exit once the calls it is making are done.
+        """
+        self._call('stop')
+
+    def _call(self, method, *args, **kwargs):
+        blobs = kwargs.pop('blobs', ())
+        span = timings.start('daemon', method=method)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            senderror = None
+            try:
+                sock.connect(self.path)
+                try:
+                    _send(sock, {'method': method, 'args': _encode(args),
+                                 'kwargs': _encode(kwargs)}, blobs)
+                except socket.error, e:
+                    # the daemon may have answered before taking it all,
+                    # its reply tells what went wrong
+                    senderror = e
+                fp = sock.makefile('rb')
+                try:
+                    reply = _receive(fp)[0]
+                finally:
+                    fp.close()
+            except (socket.error, EOFError, ValueError), e:
+                raise ReviewBoardError('lost the session daemon at %s: %s'
+                                       % (self.path, senderror or e))
+        finally:
+            sock.close()
+            span.finish()
+        if 'error' in reply:
+            raise ReviewBoardError(reply['error'])
+        return reply['result']
+
+class SessionServer:
+    """
+    Answers the calls of DaemonClients on listener with client, each on a
+    thread of its own.  serve returns once no call has come in for
+    idle_timeout seconds and none is running, or once a DaemonClient has
+    called stop and the running calls are done, and removes the socket at
+    path.
+    """
+    def __init__(self, client, listener, path,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.client = client
+        self.listener = listener
+        self.path = path
+        self.idle_timeout = idle_timeout
+        # a later daemon may have replaced the socket, which is left alone
+        self._inode = os.stat(path).st_ino
+        self._active = 0
+        # calls being made with client
+        self._calls = 0
+        self._lock = threading.Condition()
+        # written to by stop to wake serve up
+        self._wakeup = os.pipe()
+        self._stopping = False
+
+    def serve(self):
+        try:
+            while not self._stopping:
+                ready = select.select([self.listener, self._wakeup[0]], [],
+                                      [], self.idle_timeout)[0]
+                if self.listener in ready and not self._stopping:
+                    conn = self.listener.accept()[0]
+                    self._begin()
+                    thread = threading.Thread(target=self._handle,
+                                              args=(conn,))
+                    thread.setDaemon(True)
+                    thread.start()
+                elif not ready and not self._running():
+                    break
+        finally:
+            self.listener.close()
+            try:
+                if os.stat(self.path).st_ino == self._inode:
+                    _unlink(self.path)
+            except OSError:
+                pass
+        # let the running calls finish
+        self._lock.acquire()
+        try:
+            while self._active:
+                self._lock.wait()
+        finally:
+            self._lock.release()
+        for fd in self._wakeup:
+            os.close(fd)
+
+    def stop(self):
+        self._stopping = True
+        os.write(self._wakeup[1], 'x')
+
+    def _begin(self):
+        self._lock.acquire()
+        self._active += 1
+        self._lock.release()
+
+    def _running(self):
+        self._lock.acquire()
+        try:
+            return self._active
+        finally:
+            self._lock.release()
+
+    def _handle(self, conn):
+        try:
+            fp = conn.makefile('rb')
+            try:
+                message, blobs = _receive(fp)
+            finally:
+                fp.close()
+            try:
+                reply = {'result': self._dispatch(message, blobs)}
+            except ReviewBoardError, e:
+                if e.msg is not None:
+                    reply = {'error': dict(e.tags, err={'msg': e.msg,
+                                                        'code': e.code})}
+                else:
+                    reply = {'error': str(e)}
+            except Exception, e:
+                reply = {'error': '%s: %s' % (e.__class__.__name__, e)}
+            for blob in blobs:
+                blob.close()
+            _send(conn, reply)
+        except (socket.error, EOFError, ValueError):
+            # the client went away, there is nobody to tell
+            pass
+        finally:
+            conn.close()
+            self._lock.acquire()
+            self._active -= 1
+            self._lock.notifyAll()
+            self._lock.release()
+
+    def _dispatch(self, message, blobs):
+        method = message['method']
+        if method == 'stop':
+            self.stop()
+            return None
+        if method not in METHODS:
+            raise ReviewBoardError('unknown method %s' % method)
+        args = _decode(message['args']) + blobs
+        kwargs = _decode(message['kwargs'])
+        # what the client listed for an earlier call may be stale by now;
+        # it is only dropped while no other call is using it
+        self._lock.acquire()
+        try:
+            if not self._calls:
+                self.client.forget()
+            self._calls += 1
+        finally:
+            self._lock.release()
+        try:
+            result = getattr(self.client, method)(*args, **kwargs)
+        finally:
+            self._lock.acquire()
+            self._calls -= 1
+            self._lock.release()
+        if method == 'repositories':
+            return [r.__dict__ for r in result]
+        if method == 'find_repository':
+            return result and result.__dict__
+        return result
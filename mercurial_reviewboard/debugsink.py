@@ -0,0 +1,46 @@
+# debug output of the reviewboard extension, which costs nothing while it is
+# turned off
+
+import errno
+import os
+
+def debug(ui, msg, *args):
+    """
+    Writes msg % args to the debug output of ui.  The message is only
+    formatted if --debug is on; ui may be None, when there is no output.
+    """
+    if ui is None or not ui.debugflag:
+        return
+    if args:
+        msg = msg % args
+    ui.debug(msg)
+
+class DiffSink:
+    """
+    Writes the diffs of a post to files in a directory, for postreview
+    --dump-diffs.  The diffs are copied one chunk at a time, so they are
+    never held in memory as a whole.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def dump(self, name, diff):
+        """
+        Writes the chunks of diff to the file name in the directory and
+        returns its path.
+        """
+        try:
+            os.makedirs(self.directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+        path = os.path.join(self.directory, name)
+        if isinstance(diff, str):
+            diff = [diff]
+        fp = open(path, 'wb')
+        try:
+            for chunk in diff:
+                fp.write(chunk)
+        finally:
+            fp.close()
+        return path
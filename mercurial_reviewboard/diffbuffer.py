@@ -0,0 +1,83 @@
+# spooled storage for the diffs posted by the reviewboard extension
+
+import os
+import tempfile
+
+# diffs larger than this are moved from memory to a temporary file
+DEFAULT_SPOOL_SIZE = 8 * 1024 * 1024
+
+# size of the blocks handed out when a diff is read back
+BLOCK_SIZE = 64 * 1024
+
+class DiffBuffer:
+    """
+    Holds the text of a diff while it is passed from the diff generator to
+    the upload code.  The text is kept in memory until it grows beyond
+    spool_size bytes and is then moved to a temporary file, so a huge diff
+    never has to exist as a single string.
+    """
+    def __init__(self, spool_size=DEFAULT_SPOOL_SIZE):
+        self._file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        self._size = 0
+
+    def write(self, data):
+        self._file.seek(0, 2)
+        self._file.write(data)
+        self._size += len(data)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return self.chunks()
+
+    def chunks(self, blocksize=BLOCK_SIZE):
+        """
+        Yields the diff in blocks of at most blocksize bytes.
+        """
+        self._file.seek(0)
+        while True:
+            data = self._file.read(blocksize)
+            if not data:
+                break
+            yield data
+
+    def getvalue(self):
+        """
+        Returns the whole diff as a string.  Only use this for diffs that
+        are known to be small.
+        """
+        return ''.join(self.chunks())
+
+    def close(self):
+        self._file.close()
+
+
+def spooldiff(chunks, spool_size=DEFAULT_SPOOL_SIZE):
+    """
+    Writes the chunks produced by a diff generator to a new DiffBuffer.
+    """
+    diff = DiffBuffer(spool_size)
+    for chunk in chunks:
+        diff.write(chunk)
+    return diff
+
+
+def spoolfile(path, spool_size=DEFAULT_SPOOL_SIZE, diff=None):
+    """
+    Moves the contents of the file at path to the end of diff, or to a new
+    DiffBuffer, and removes the file.
+    """
+    if diff is None:
+        diff = DiffBuffer(spool_size)
+    fp = open(path, 'rb')
+    try:
+        while True:
+            block = fp.read(BLOCK_SIZE)
+            if not block:
+                break
+            diff.write(block)
+    finally:
+        fp.close()
+    os.unlink(path)
+    return diff
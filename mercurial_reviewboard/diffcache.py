@@ -0,0 +1,139 @@
+# on-disk cache of the diffs computed by the reviewboard extension
+
+import hashlib
+import os
+import zlib
+
+from mercurial.node import hex
+
+from diffbuffer import BLOCK_SIZE, DEFAULT_SPOOL_SIZE, DiffBuffer
+
+# total size of the compressed diffs kept before the least recently used
+# ones are removed
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+# changes whenever the way diffs are stored or produced changes
+FORMAT = '1'
+
+class DiffCache:
+    """
+    Keeps diffs between changesets in a directory, compressed, under a key
+    made from the two nodes and the options that affect the text of the
+    diff.  Changesets never change, so a cached diff is good for as long as
+    it is kept; the directory may therefore be shared between clones.
+
+    When the files take up more than maxsize bytes, the least recently
+    used ones are removed.  hits and misses count the lookups.
+    """
+    def __init__(self, path, maxsize=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, node1, node2, options=()):
+        """
+        Returns the key of the diff from node1 to node2 produced with
+        options, a sequence of (name, value) pairs.
+        """
+        h = hashlib.sha1(FORMAT)
+        h.update(hex(node1))
+        h.update(hex(node2))
+        for name, value in sorted(options):
+            h.update('\0%s=%r' % (name, value))
+        return h.hexdigest()
+
+    def get(self, key, spool_size=DEFAULT_SPOOL_SIZE):
+        """
+        Returns the diff stored under key as a DiffBuffer, or None.
+        """
+        filename = self._filename(key)
+        try:
+            fp = open(filename, 'rb')
+        except IOError:
+            self.misses += 1
+            return None
+        diff = DiffBuffer(spool_size)
+        try:
+            try:
+                decompressor = zlib.decompressobj()
+                while True:
+                    block = fp.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    diff.write(decompressor.decompress(block))
+                diff.write(decompressor.flush())
+            finally:
+                fp.close()
+        except (IOError, zlib.error):
+            # a damaged entry is the same as none
+            diff.close()
+            self._remove(filename)
+            self.misses += 1
+            return None
+        self.hits += 1
+        # the modification time orders the entries for eviction
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return diff
+
+    def put(self, key, diff):
+        """
+        Stores diff, a string or a DiffBuffer, under key.  The cache is
+        only an optimization, errors writing it are ignored.
+        """
+        filename = self._filename(key)
+        tmp = '%s.%d.tmp' % (filename, os.getpid())
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            fp = open(tmp, 'wb')
+            try:
+                compressor = zlib.compressobj()
+                if isinstance(diff, str):
+                    diff = [diff]
+                for block in diff:
+                    fp.write(compressor.compress(block))
+                fp.write(compressor.flush())
+            finally:
+                fp.close()
+            if os.name == 'nt' and os.path.exists(filename):
+                os.remove(filename)
+            os.rename(tmp, filename)
+        except (IOError, OSError):
+            self._remove(tmp)
+            return
+        self._evict()
+
+    def _filename(self, key):
+        return os.path.join(self.path, key)
+
+    def _remove(self, filename):
+        try:
+            os.unlink(filename)
+        except OSError:
+            pass
+
+    def _evict(self):
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+        entries = []
+        total = 0
+        for name in names:
+            if name.endswith('.tmp'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name, st.st_size))
+            total += st.st_size
+        entries.sort()
+        while total > self.maxsize and entries:
+            mtime, name, size = entries.pop(0)
+            self._remove(os.path.join(self.path, name))
+            total -= size
@@ -0,0 +1,136 @@
+# drops files that should not be reviewed from the diffs posted by the
+# reviewboard extension
+
+import fnmatch
+import re
+
+from diffbuffer import DEFAULT_SPOOL_SIZE, DiffBuffer
+
+# the revisions in the header of a diff in the default format
+_revs = re.compile(r'^(-r \S+ )+')
+
+def diffpath(header):
+    """
+    Returns the path of the file a 'diff ...' header line introduces.
+    """
+    header = header.rstrip('\r\n')
+    if header.startswith('diff --git a/'):
+        return header[len('diff --git a/'):].rpartition(' b/')[0]
+    header = header[len('diff '):]
+    return _revs.sub('', header)
+
+def lines(chunks):
+    """
+    Yields the lines in a sequence of chunks of text, with their line ends.
+    """
+    pending = ''
+    for chunk in chunks:
+        data = pending + chunk
+        start = 0
+        while True:
+            end = data.find('\n', start)
+            if end < 0:
+                break
+            yield data[start:end + 1]
+            start = end + 1
+        pending = data[start:]
+    if pending:
+        yield pending
+
+class _Section:
+    """
+    The part of a diff about one file, kept until it is known whether the
+    file is excluded.
+    """
+    def __init__(self, header, path, reason, spool_size):
+        self.header = header
+        self.path = path
+        self.reason = reason
+        self.size = 0
+        self.buffer = None
+        if reason is None:
+            self.buffer = DiffBuffer(spool_size)
+
+    def exclude(self, reason):
+        self.reason = reason
+        self.buffer.close()
+        self.buffer = None
+
+class DiffFilter:
+    """
+    Replaces the parts of a diff about some files with a placeholder that
+    says the file has changed, like the one Mercurial writes for binary
+    files, so the review request still lists them.  A file is excluded if
+    its path matches one of the excludes globs (a glob without a slash is
+    matched against the file name) or if its part of the diff is larger
+    than maxsize bytes (unless maxsize is 0).
+
+    The diff is filtered as it is read.  The part about one file is kept
+    in a DiffBuffer until it ends or grows beyond maxsize, so memory use
+    does not depend on the size of the diff.  The excluded files and the
+    reasons are collected in omitted.
+    """
+    def __init__(self, excludes=(), maxsize=0, spool_size=DEFAULT_SPOOL_SIZE):
+        self.excludes = list(excludes)
+        self.maxsize = maxsize
+        self.spool_size = spool_size
+        self.omitted = []
+
+    def matches(self, path):
+        """
+        Returns whether path matches one of the exclude globs.
+        """
+        name = path.rpartition('/')[2]
+        for pattern in self.excludes:
+            if '/' in pattern:
+                if fnmatch.fnmatchcase(path, pattern):
+                    return True
+            elif fnmatch.fnmatchcase(name, pattern):
+                return True
+        return False
+
+    def filter(self, chunks, omit=()):
+        """
+        Yields the chunks of the filtered diff.  The files in omit are
+        excluded as well, only by their path.
+        """
+        section = None
+        for line in lines(chunks):
+            if line.startswith('diff '):
+                if section is not None:
+                    for chunk in self._finish(section):
+                        yield chunk
+                section = self._start(line, omit)
+            elif section is None:
+                yield line
+            elif section.reason is None:
+                self._add(section, line)
+        if section is not None:
+            for chunk in self._finish(section):
+                yield chunk
+
+    def _start(self, header, omit):
+        path = diffpath(header)
+        reason = None
+        if path in omit:
+            reason = 'excluded from the diff'
+        elif self.matches(path):
+            reason = 'excluded by pattern'
+        return _Section(header, path, reason, self.spool_size)
+
+    def _add(self, section, line):
+        section.size += len(line)
+        if self.maxsize and section.size > self.maxsize:
+            section.exclude('larger than %d bytes' % self.maxsize)
+            return
+        section.buffer.write(line)
+
+    def _finish(self, section):
+        yield section.header
+        if section.reason is not None:
+            self.omitted.append((section.path, section.reason))
+            yield 'Binary file %s has changed\n' % section.path
+        else:
+            for chunk in section.buffer:
+                yield chunk
+            section.buffer.close()
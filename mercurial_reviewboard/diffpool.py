@@ -0,0 +1,184 @@
+# computes diffs file by file in worker processes for the reviewboard
+# extension
+
+import os
+import shutil
+import tempfile
+
+from mercurial import hg, patch, ui
+
+from diffbuffer import DEFAULT_SPOOL_SIZE, DiffBuffer, spoolfile
+
+# most files diffed by one job of a worker process
+CHUNK_FILES = 64
+
+# changed files smaller than this in all are diffed in the calling process,
+# starting the worker processes takes longer than diffing them
+DEFAULT_MIN_SIZE = 4 * 1024 * 1024
+
+# repositories opened by a worker process, by root
+_repos = {}
+
+def _repository(root):
+    repo = _repos.get(root)
+    if repo is None:
+        repo = _repos[root] = hg.repository(ui.ui(), root)
+    return repo
+
+def writediff(repo, node1, node2, changes, fp):
+    """
+    Writes the diff between two nodes to fp, limited to the files in
+    changes, a tuple of the modified, added and removed files.
+    """
+    if not changes[0] and not changes[1] and not changes[2]:
+        return
+    for chunk in patch.diff(repo, node1, node2, changes=changes):
+        fp.write(chunk)
+
+def _diff(job):
+    """
+    Runs in a worker process: writes the diff of a range of files to a new
+    file in directory and returns its name.
+    """
+    root, node1, node2, changes, quiet, debugflag, directory = job
+    repo = _repository(root)
+    # the diff headers depend on these, follow the calling process
+    repo.ui.quiet = quiet
+    repo.ui.debugflag = debugflag
+    fd, path = tempfile.mkstemp(prefix='diff-', dir=directory)
+    fp = os.fdopen(fd, 'wb')
+    try:
+        writediff(repo, node1, node2, changes, fp)
+    finally:
+        fp.close()
+    return path
+
+def estimate(repo, node1, node2, changes, limit=None):
+    """
+    Returns the total size in bytes of the files in changes in both nodes,
+    which the work of diffing them grows with.  Counting stops once the
+    total reaches limit.
+    """
+    modified, added, removed = changes[:3]
+    total = 0
+    for ctx, files in ((repo[node2], modified + added),
+                       (repo[node1], modified + removed)):
+        for f in files:
+            total += ctx[f].size()
+            if limit is not None and total >= limit:
+                return total
+    return total
+
+def split(changes, size=CHUNK_FILES):
+    """
+    Splits the modified, added and removed files in changes into tuples of
+    the same form covering at most size files each.  patch.diff writes
+    files in sorted path order whatever list they are in, so the chunks
+    cover consecutive ranges of paths and their diffs add up to the diff
+    of all the files.
+    """
+    modified, added, removed = [set(files) for files in changes[:3]]
+    files = sorted(modified | added | removed)
+    chunks = []
+    for i in range(0, len(files), size):
+        chunk = files[i:i + size]
+        chunks.append(([f for f in chunk if f in modified],
+                       [f for f in chunk if f in added],
+                       [f for f in chunk if f in removed]))
+    return chunks
+
+def _multiprocessing():
+    # multiprocessing does not get along with the lazy module loading of
+    # mercurial, import it for real and leave demandimport as it was
+    import __builtin__
+    from mercurial import demandimport
+    enabled = __builtin__.__import__ is demandimport._demandimport
+    demandimport.disable()
+    try:
+        import multiprocessing
+    finally:
+        if enabled:
+            demandimport.enable()
+    return multiprocessing
+
+def cpu_count():
+    try:
+        return _multiprocessing().cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+class DiffPool:
+    """
+    Computes diffs between pairs of changesets in up to size worker
+    processes, one per CPU if size is 0, since diffing is bound by the CPU and threads would take
+    turns holding the interpreter lock.
+
+    The files changed between each pair are found from the manifests and
+    split into ranges of at most chunk_files paths, and the ranges of all
+    the diffs are handed to the workers as one queue, so that a single
+    diff touching thousands of files is spread over all of them.  Each
+    worker opens the repository itself and writes the diff of its range
+    to a temporary file.  The files are put back together in path order,
+    which gives the same bytes as diffing in one go.
+
+    If the changed files come to less than min_size bytes, the diffs are
+    computed in the calling process instead.
+    """
+    def __init__(self, size, chunk_files=CHUNK_FILES,
+                 min_size=DEFAULT_MIN_SIZE):
+        self.size = max(0, size)
+        self.chunk_files = chunk_files
+        self.min_size = min_size
+
+    def diffs(self, repo, pairs, spool_size=DEFAULT_SPOOL_SIZE):
+        """
+        Returns a DiffBuffer for every (node1, node2) pair in pairs, with the
+        changes from node1 to node2, in the same order.
+        """
+        chunks = []
+        total = 0
+        for node1, node2 in pairs:
+            changes = repo.status(node1, node2)[:3]
+            chunks.append([(node1, node2, c)
+                           for c in split(changes, self.chunk_files)])
+            if total < self.min_size:
+                total += estimate(repo, node1, node2, changes,
+                                  self.min_size - total)
+
+        jobs = sum(chunks, [])
+        size = 1
+        if len(jobs) > 1 and total >= self.min_size:
+            size = self.size or cpu_count()
+        if size < 2:
+            # not worth starting processes for
+            return [self._diff(repo, pairchunks, spool_size)
+                    for pairchunks in chunks]
+
+        directory = tempfile.mkdtemp(prefix='hg-reviewboard-')
+        try:
+            jobs = [(repo.root, node1, node2, changes, repo.ui.quiet,
+                     repo.ui.debugflag, directory)
+                    for node1, node2, changes in jobs]
+            pool = _multiprocessing().Pool(min(size, len(jobs)))
+            try:
+                paths = pool.map(_diff, jobs)
+            finally:
+                pool.close()
+                pool.join()
+
+            diffs = []
+            for pairchunks in chunks:
+                diff = DiffBuffer(spool_size)
+                for path in paths[:len(pairchunks)]:
+                    spoolfile(path, diff=diff)
+                del paths[:len(pairchunks)]
+                diffs.append(diff)
+            return diffs
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _diff(self, repo, chunks, spool_size):
+        diff = DiffBuffer(spool_size)
+        for node1, node2, changes in chunks:
+            writediff(repo, node1, node2, changes, diff)
+        return diff
@@ -0,0 +1,35 @@
+# errors of the Review Board API client, kept apart from reviewboard.py so
+# that they can be caught without importing the HTTP and JSON code
+
+class APIError(Exception):
+    pass
+
+class ReviewBoardError(Exception):
+    def __init__(self, json=None):
+        self.msg = None
+        self.code = None
+        self.tags = {}
+
+        if isinstance(json, str) or isinstance(json, unicode):
+            try:
+                import json as simplejson
+                json = simplejson.loads(json)
+            except:
+                self.msg = json
+                return
+
+        if json:
+            if json.has_key('err'):
+                self.msg = json['err']['msg']
+                self.code = json['err']['code']
+            for key, value in json.items():
+                if isinstance(value,unicode) or isinstance(value,str) or \
+                    key == 'fields':
+                    self.tags[key] = value
+
+    def __str__(self):
+        if self.msg:
+            return ("%s (%s)" % (self.msg, self.code)) + \
+                ''.join([("\n%s: %s" % (k, v)) for k,v in self.tags.items()])
+        else:
+            return Exception.__str__(self)
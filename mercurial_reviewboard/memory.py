@@ -0,0 +1,47 @@
+# resident memory of the process, for postreview --profile-memory
+
+import os
+import sys
+
+def rss():
+    """
+    Returns the resident set size of the process in bytes, or None where
+    /proc is not available.
+    """
+    try:
+        fp = open('/proc/self/statm')
+        try:
+            fields = fp.read().split()
+        finally:
+            fp.close()
+        return int(fields[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+def peak_rss():
+    """
+    Returns the largest resident set size the process has had so far in
+    bytes, or None where neither /proc nor the resource module is
+    available.
+    """
+    # the high-water mark in /proc starts over when a program is executed,
+    # while ru_maxrss keeps that of the process that started it
+    try:
+        fp = open('/proc/self/status')
+        try:
+            for line in fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+        finally:
+            fp.close()
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        return None
+    if sys.platform == 'darwin':
+        return peak
+    # kilobytes elsewhere
+    return peak * 1024
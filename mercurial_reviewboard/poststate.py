@@ -0,0 +1,130 @@
+# state the reviewboard extension keeps in the repository between runs
+
+import hashlib
+import json
+import os
+
+from mercurial import util
+
+def loadjson(path):
+    """
+    Returns the dictionary stored in the JSON file at path, or an empty one
+    if the file is missing or unreadable.
+    """
+    try:
+        fp = open(path)
+        try:
+            data = json.load(fp)
+        finally:
+            fp.close()
+    except (IOError, OSError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return data
+
+def savejson(path, data):
+    """
+    Replaces the JSON file at path with data.  Errors are ignored, the
+    state only saves work on later runs.
+    """
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        fp = open(tmp, 'w')
+        try:
+            json.dump(data, fp, sort_keys=True)
+        finally:
+            fp.close()
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        pass
+
+def digest(data):
+    """
+    Returns the SHA-1 hex digest of a string, or of the blocks of a
+    DiffBuffer, without joining them into one string.
+    """
+    h = hashlib.sha1()
+    if isinstance(data, basestring):
+        h.update(data)
+    else:
+        for block in data:
+            h.update(block)
+    return h.hexdigest()
+
+def fields_digest(fields):
+    return digest(json.dumps(fields, sort_keys=True))
+
+def post_digests(fields, diff, parentdiff):
+    """
+    Returns the digests that PostState records for a review request.
+    """
+    return {'fields': fields_digest(fields),
+            'diff': digest(diff),
+            'parentdiff': digest(parentdiff)}
+
+class PostState:
+    """
+    Records the digests of the fields, diff and parent diff last posted to
+    each review request on a server, so that posting an unchanged changeset
+    again can skip the uploads.  The digests are kept in a JSON file; a
+    missing or unreadable file only means that everything is posted again.
+    """
+    def __init__(self, path, server):
+        self.path = path
+        self.server = server.rstrip('/')
+
+    def get(self, request_id):
+        """
+        Returns the digests recorded for request_id, or an empty dictionary.
+        """
+        return loadjson(self.path).get(self.server, {}).get(str(request_id),
+                                                            {})
+
+    def record(self, request_id, digests):
+        data = loadjson(self.path)
+        data.setdefault(self.server, {})[str(request_id)] = digests
+        savejson(self.path, data)
+
+    def forget(self, request_id):
+        data = loadjson(self.path)
+        if data.get(self.server, {}).pop(str(request_id), None) is not None:
+            savejson(self.path, data)
+
+class DiscoveryCache:
+    """
+    Records the result of the last outgoing discovery against each remote:
+    the heads of the remote, the heads of the local repository and the
+    heads of the changesets the two had in common.  As long as neither
+    side has new heads, the common heads are still right and the outgoing
+    changesets can be worked out locally.  Remotes are recorded without
+    the user name and password their URL may carry.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def common(self, remote, remoteheads, localheads):
+        """
+        Returns the common heads recorded for remote if the remote and local
+        heads are the same as then, or None.  Heads are hex node IDs.
+        """
+        entry = loadjson(self.path).get(util.removeauth(remote))
+        if (entry is None or entry.get('remoteheads') != sorted(remoteheads)
+            or entry.get('localheads') != sorted(localheads)):
+            return None
+        return entry.get('common')
+
+    def record(self, remote, remoteheads, localheads, common):
+        # entries written before the credentials were removed are dropped
+        data = dict([(k, v) for k, v in loadjson(self.path).items()
+                     if util.removeauth(k) == k])
+        data[util.removeauth(remote)] = {
+            'remoteheads': sorted(remoteheads),
+            'localheads': sorted(localheads),
+            'common': sorted(common)}
+        savejson(self.path, data)
@@ -0,0 +1,128 @@
+# ancestry queries over revision numbers for the reviewboard extension
+
+from mercurial.node import nullrev
+
+class RevGraph:
+    """
+    Answers the ancestry questions postreview asks about a repository by
+    walking the parent revision numbers in the changelog index, instead of
+    going through changesets and nodes.  Like nodesbetween, a walk stops
+    at the lowest revision the question is about, so its cost follows the
+    changesets being posted rather than the whole history.  The ancestors
+    found by a walk are kept for the rest of the command.
+    """
+    def __init__(self, repo):
+        self._repo = repo
+        self._changelog = repo.changelog
+        self._length = len(repo.changelog)
+        self._ancestors = {}
+
+    def current(self):
+        """
+        Returns whether the repository has not grown since the graph was
+        created.
+        """
+        return len(self._repo.changelog) == self._length
+
+    def parents(self, rev):
+        return [p for p in self._changelog.parentrevs(rev) if p != nullrev]
+
+    def ancestors(self, rev, stop=0):
+        """
+        Returns the set of rev and those of its ancestors whose revision
+        number is stop or higher.
+        """
+        key = (rev, stop)
+        if key in self._ancestors:
+            return self._ancestors[key]
+        ancestors = set()
+        if rev != nullrev and rev >= stop:
+            ancestors.add(rev)
+            parentrevs = self._changelog.parentrevs
+            visit = [rev]
+            while visit:
+                for p in parentrevs(visit.pop()):
+                    # parents have lower revision numbers than their
+                    # children, nothing below stop leads back above it
+                    if p >= stop and p not in ancestors:
+                        ancestors.add(p)
+                        visit.append(p)
+        self._ancestors[key] = ancestors
+        return ancestors
+
+    def between(self, base, head):
+        """
+        Returns the revisions that are descendants of base and ancestors of
+        head, both included, in ascending order.  Like nodesbetween, the
+        result is empty if base is not an ancestor of head; the null
+        revision as base stands for the roots of the repository and is
+        never part of the result.
+        """
+        if base == nullrev:
+            return sorted(self.ancestors(head))
+        ancestors = self.ancestors(head, base)
+        if base not in ancestors:
+            return []
+        # parents come before their children in revision order, so one
+        # ascending pass finds every descendant of base
+        descendants = set([base])
+        for rev in sorted(ancestors):
+            if rev > base and any(p in descendants
+                                  for p in self.parents(rev)):
+                descendants.add(rev)
+        return sorted(descendants)
+
+    def heads(self, revs):
+        """
+        Returns the revisions in revs that are not a parent of another
+        revision in revs, in ascending order.
+        """
+        revs = set(revs)
+        parents = set()
+        for rev in revs:
+            parents.update(self.parents(rev))
+        return sorted(revs - parents)
+
+    def remoteparent(self, rev, outgoing):
+        """
+        Returns the first parent of the first of the outgoing revisions
+        that is an ancestor of rev, or None if there is none.
+        """
+        if not outgoing:
+            return None
+        ancestors = self.ancestors(rev, min(outgoing))
+        for o in outgoing:
+            if o in ancestors:
+                return self._changelog.parentrevs(o)[0]
+        return None
+
+    def branch_root(self, rev):
+        """
+        Returns the revision the named branch of rev was started from,
+        following first parents, or the null revision if the branch goes
+        back to the root of the repository.
+        """
+        branch = self._branch(rev)
+        while self._branch(rev) == branch:
+            parent = self._changelog.parentrevs(rev)[0]
+            if parent == nullrev:
+                return nullrev
+            rev = parent
+        return rev
+
+    def _branch(self, rev):
+        # the branch name is in the extra fields of the changelog entry,
+        # reading it does not need a changectx
+        return self._changelog.read(self._changelog.node(rev))[5]['branch']
+
+
+def revgraph(repo):
+    """
+    Returns the RevGraph of repo, which is created once for a command and
+    shared by all the lookups made while it runs.
+    """
+    graph = getattr(repo, '_reviewboard_revgraph', None)
+    if graph is None or not graph.current():
+        graph = RevGraph(repo)
+        repo._reviewboard_revgraph = graph
+    return graph
@@ -33,6 +33,12 @@ def get_repo(ui, name):
     repo = hg.repository(ui, repo_path)
     return repo
 
+def forget_posts(name='two_revs'):
+    '''remove what postreview recorded about earlier posts from a test repo'''
+    state_dir = '%s/%s/.hg/reviewboard' % (repos_dir, name)
+    if os.path.exists(state_dir):
+        shutil.rmtree(state_dir)
+
 def mock_ui():
     def create_mock(ui):
         mock = Mock(wraps=ui)
@@ -0,0 +1,77 @@
+'''Measures the bytes sent on the wire when uploading a diff with and
+without gzip compression of the request body (reviewboard.compress_uploads).
+
+The stub server accepts compressed bodies, so the savings can be measured
+locally even when the real Review Board server does not take them.  Pass a
+diff with --diff (e.g. the output of "hg diff -r REV"), otherwise a
+synthetic one of --size bytes is used.
+
+    python -m mercurial_reviewboard.tests.benchmarks.bench_compression
+'''
+
+import optparse
+import time
+
+from mercurial_reviewboard.diffbuffer import spooldiff
+from mercurial_reviewboard.reviewboard import Api20Client, HttpClient
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+
+def synthetic_diff(size):
+    chunks = []
+    length = 0
+    i = 0
+    while length < size:
+        chunk = ('diff -r 000000000000 -r 111111111111 src/module%d.py\n'
+                 '--- a/src/module%d.py\n+++ b/src/module%d.py\n'
+                 '@@ -%d,3 +%d,3 @@\n'
+                 '     def method_%d(self, value):\n'
+                 '-        return self.compute(value, %d)\n'
+                 '+        return self.compute(value, %d) + 1\n'
+                 % (i, i, i, i, i, i, i, i))
+        chunks.append(chunk)
+        length += len(chunk)
+        i += 1
+    return ''.join(chunks)
+
+
+def run(label, server, diff, compress, iterations):
+    del server.requests[:]
+    start = time.time()
+    for i in range(iterations):
+        httpclient = HttpClient(server.url, compress_uploads=compress)
+        httpclient.cookie_file = '/dev/null'
+        Api20Client(httpclient).new_request('1', {}, spooldiff([diff]))
+        httpclient.pool.close()
+    elapsed = (time.time() - start) / iterations
+    sent = sum([r[2] for r in server.requests
+                if r[1].endswith('/diffs/')]) / iterations
+    print '%-12s %10d bytes %8.1f ms' % (label, sent, elapsed * 1000)
+    return sent
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--diff', help='file with the diff to upload')
+    parser.add_option('--size', type='int', default=4 * 1024 * 1024,
+                      help='size of the synthetic diff in bytes')
+    parser.add_option('--iterations', type='int', default=5)
+    opts, args = parser.parse_args()
+
+    if opts.diff:
+        diff = open(opts.diff, 'rb').read()
+    else:
+        diff = synthetic_diff(opts.size)
+    print 'diff: %d bytes' % len(diff)
+
+    server = StubServer(accept_gzip=True).start()
+    try:
+        plain = run('plain', server, diff, False, opts.iterations)
+        gzipped = run('gzip', server, diff, True, opts.iterations)
+    finally:
+        server.stop()
+    print 'saved %.1f%% of the upload' % (100.0 * (plain - gzipped) / plain)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+'''Times computing the diffs of review requests with one and more diff
+worker processes (reviewboard.diff_workers).
+
+A synthetic repository is created with a first changeset of --files files,
+a second one that rewrites all of them, which gives a large parent diff,
+and --stack more changesets on top that each change a few files, like a
+stack posted with --each.  The files of each diff are spread over the
+workers, so the single review request scales with the number of files
+and the stack with the number of changesets as well.
+
+    python -m mercurial_reviewboard.tests.benchmarks.bench_diffs
+'''
+
+import optparse
+import os
+import shutil
+import tempfile
+import time
+
+from mercurial import commands, hg, ui as uimod
+
+from mercurial_reviewboard import create_reviews_data
+from mercurial_reviewboard.diffpool import cpu_count
+
+
+def write_files(root, files, lines, seed):
+    for i in range(files):
+        fp = open(os.path.join(root, 'file%05d.txt' % i), 'w')
+        for j in range(lines):
+            fp.write('line %d of file %d, version %d\n' % (j, i, seed + j % 7))
+        fp.close()
+
+
+def create_repository(path, files, lines, stack):
+    ui = uimod.ui()
+    ui.setconfig('ui', 'quiet', 'true')
+    repo = hg.repository(ui, path, create=True)
+    write_files(path, files, lines, 0)
+    commands.add(ui, repo)
+    commands.commit(ui, repo, message='base', user='bench')
+    write_files(path, files, lines, 1)
+    commands.commit(ui, repo, message='rewrite', user='bench')
+    for n in range(stack):
+        write_files(path, max(1, files / 20), lines, n + 2)
+        commands.commit(ui, repo, message='change %d' % n, user='bench')
+    return hg.repository(ui, path)
+
+
+def run(repo, reviews, workers, iterations):
+    ui = repo.ui.copy()
+    ui.setconfig('reviewboard', 'diff_workers', str(workers))
+    # time the workers whatever the size of the diffs
+    ui.setconfig('reviewboard', 'diff_pool_min_size', '0')
+    start = time.time()
+    for i in range(iterations):
+        for diff, parentdiff in create_reviews_data(ui, repo, reviews):
+            diff.close()
+            if parentdiff:
+                parentdiff.close()
+    return (time.time() - start) / iterations
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--files', type='int', default=400)
+    parser.add_option('--lines', type='int', default=200)
+    parser.add_option('--stack', type='int', default=8)
+    parser.add_option('--iterations', type='int', default=3)
+    parser.add_option('--max-workers', type='int', default=cpu_count())
+    opts, args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-diffs-')
+    try:
+        repo = create_repository(directory, opts.files, opts.lines,
+                                 opts.stack)
+        base = repo[0]
+        # one review request with a parent diff against the base, and a
+        # stack with one request per changeset
+        single = [(repo['tip'], repo['tip'].parents()[0], base)]
+        stack = [(repo[r], repo[r].parents()[0], base)
+                 for r in range(2, len(repo))]
+
+        workers = [1]
+        while workers[-1] * 2 <= opts.max_workers:
+            workers.append(workers[-1] * 2)
+        if workers[-1] != opts.max_workers:
+            workers.append(opts.max_workers)
+
+        print '%8s %12s %12s' % ('workers', 'single (s)', 'stack (s)')
+        for n in workers:
+            print '%8d %12.2f %12.2f' % (n,
+                run(repo, single, n, opts.iterations),
+                run(repo, stack, n, opts.iterations))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+'''Compares posting a review request with and without the keep-alive
+connection pool.
+
+The stub server sleeps for --connect-latency seconds on every new
+connection to stand in for the TCP and TLS handshakes with a remote
+Review Board server.
+
+    python -m mercurial_reviewboard.tests.benchmarks.bench_keepalive
+'''
+
+import optparse
+import time
+
+from mercurial_reviewboard.reviewboard import (Api20Client, ConnectionPool,
+                                               HttpClient)
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+
+def post(url, pool):
+    '''the requests made by "hg postreview -p" for a new review request'''
+    httpclient = HttpClient(url, pool=pool)
+    httpclient.cookie_file = '/dev/null'
+    httpclient.api_request('GET', '/api/')
+    client = Api20Client(httpclient)
+    id = client.new_request('1', {'summary': 'benchmark'},
+                            'diff -r 000000000000 foo\n')
+    client.publish(id)
+
+
+def run(label, server, pool, iterations):
+    server.connections = 0
+    start = time.time()
+    for i in range(iterations):
+        post(server.url, pool)
+        pool.close()
+    elapsed = (time.time() - start) / iterations
+    print '%-12s %8.1f ms %6.1f connections per post' % (
+        label, elapsed * 1000, float(server.connections) / iterations)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--connect-latency', type='float', default=0.05)
+    parser.add_option('--iterations', type='int', default=10)
+    opts, args = parser.parse_args()
+
+    server = StubServer(connect_latency=opts.connect_latency).start()
+    try:
+        run('no pool', server, ConnectionPool(maxsize=0), opts.iterations)
+        run('keep-alive', server, ConnectionPool(), opts.iterations)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
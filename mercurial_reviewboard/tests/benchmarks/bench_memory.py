@@ -0,0 +1,49 @@
+'''Posts the tip of a repository to a Review Board server in a process of
+its own and prints how far the post raised the peak resident memory of the
+process, as JSON.  bench_suite runs it to check the memory budget of a
+post, since the peak of a process can only grow.
+
+    python -m mercurial_reviewboard.tests.benchmarks.bench_memory \\
+        SERVER REPO UPSTREAM
+'''
+
+import json
+import sys
+
+from mercurial import hg
+
+from mercurial_reviewboard import postreview
+from mercurial_reviewboard.memory import peak_rss, rss
+from mercurial_reviewboard.tests.benchmarks.bench_suite import (make_ui,
+    postreview_opts)
+
+
+class Server:
+    def __init__(self, url):
+        self.url = url
+
+
+def main():
+    url, path, upstream = sys.argv[1:4]
+    ui = make_ui(Server(url))
+    repo = hg.repository(ui, path)
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        baseline = rss()
+        ui.pushbuffer()
+        try:
+            postreview(ui, repo, 'tip',
+                       **postreview_opts(outgoingrepo=upstream, repoid='1',
+                                         publish=True))
+        finally:
+            ui.popbuffer()
+        peak = peak_rss()
+    finally:
+        sys.stdout = stdout
+    print json.dumps({'baseline': baseline, 'peak': peak,
+                      'raised': peak - baseline})
+
+
+if __name__ == '__main__':
+    main()
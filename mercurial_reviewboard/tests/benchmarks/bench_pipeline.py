@@ -0,0 +1,60 @@
+'''Compares posting review requests with the requests of a post sent one
+after another, with publishing folded into the draft and with the draft
+also sent while the diff uploads (overlap_draft).
+
+The stub server sleeps for --latency seconds on every request to stand in
+for the round trip to a remote Review Board server.  The critical path is
+the number of round trips a post waits for one after another.
+
+    python -m mercurial_reviewboard.tests.benchmarks.bench_pipeline
+'''
+
+import optparse
+import time
+
+from mercurial_reviewboard.reviewboard import (Api20Client, ConnectionPool,
+                                               HttpClient)
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+DIFF = 'diff -r 000000000000 foo\n'
+
+
+def run(label, server, pipeline, overlap, publish, iterations):
+    httpclient = HttpClient(server.url, pool=ConnectionPool())
+    httpclient.cookie_file = '/dev/null'
+    client = Api20Client(httpclient)
+    client.pipeline = pipeline
+    client.overlap_draft = overlap
+    del server.requests[:]
+    start = time.time()
+    for i in range(iterations):
+        client.new_request('1', {'summary': 'benchmark'}, DIFF,
+                           publish=publish)
+    elapsed = (time.time() - start) / iterations
+    requests = float(len(server.requests)) / iterations
+    print '%-24s %8.1f ms %4.1f requests %4.1f round trips per post' % (
+        label, elapsed * 1000, requests, elapsed / server.latency)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--latency', type='float', default=0.05)
+    parser.add_option('--iterations', type='int', default=10)
+    opts, args = parser.parse_args()
+
+    server = StubServer(latency=opts.latency).start()
+    try:
+        for publish in (False, True):
+            suffix = publish and ', published' or ''
+            run('sequential' + suffix, server, False, False, publish,
+                opts.iterations)
+            run('pipelined' + suffix, server, True, False, publish,
+                opts.iterations)
+            run('overlapped' + suffix, server, True, True, publish,
+                opts.iterations)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+'''Measures what enabling the extension adds to the start of every hg
+command: "hg version" is timed with and without the extension enabled in
+the configuration, and the modules loading the extension imports are
+listed, so that the HTTP and JSON modules creeping back into the import
+time of the extension are noticed.
+
+    python -m mercurial_reviewboard.tests.benchmarks.bench_startup
+'''
+
+import optparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# imported by the extension the first time postreview runs, never before
+HEAVY = ['cookielib', 'datetime', 'getpass', 'httplib', 'json',
+         'mimetools', 'urllib2']
+
+# prints the modules the extension imports while hg loads it
+LOADED = '''
+import sys
+from mercurial import demandimport
+demandimport.enable()
+from mercurial import extensions, ui
+u = ui.ui()
+before = set([k for k in sys.modules if sys.modules[k] is not None])
+extensions.load(u, 'reviewboard', sys.argv[1]).cmdtable
+for name in sorted(sys.modules):
+    if sys.modules[name] is not None and name not in before:
+        print name
+'''
+
+
+def hgrc(directory, extension):
+    '''write an hgrc, enabling the extension if it is given'''
+    path = os.path.join(directory, extension and 'with.rc' or 'without.rc')
+    fp = open(path, 'w')
+    try:
+        if extension:
+            fp.write('[extensions]\nreviewboard = %s\n' % extension)
+    finally:
+        fp.close()
+    return path
+
+
+def run(hg, rcpath, iterations):
+    '''time "hg version" with HGRCPATH set to rcpath'''
+    env = dict(os.environ)
+    env['HGRCPATH'] = rcpath
+    times = []
+    for i in range(iterations):
+        start = time.time()
+        subprocess.check_call([hg, 'version', '-q'], env=env,
+                              stdout=open(os.devnull, 'w'))
+        times.append(time.time() - start)
+    return times
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--hg', default='hg', help='the hg command to run')
+    parser.add_option('--iterations', type='int', default=20)
+    opts, args = parser.parse_args()
+
+    extension = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    directory = tempfile.mkdtemp(prefix='bench-startup-')
+    try:
+        results = {}
+        for label, ext in (('without', None), ('with', extension)):
+            times = run(opts.hg, hgrc(directory, ext), opts.iterations)
+            results[label] = times
+            print '%-8s %8.1f ms (min %.1f ms)' % (
+                label, sum(times) / len(times) * 1000, min(times) * 1000)
+    finally:
+        shutil.rmtree(directory)
+    print '%-8s %8.1f ms' % ('added', (min(results['with']) -
+                                       min(results['without'])) * 1000)
+
+    loaded = subprocess.Popen([sys.executable, '-c', LOADED, extension],
+                              stdout=subprocess.PIPE).communicate()[0].split()
+    print 'modules imported by loading the extension:'
+    for name in loaded:
+        print '    %s' % name
+    heavy = [name for name in HEAVY if name in loaded]
+    if heavy:
+        print 'imported too early: %s' % ', '.join(heavy)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+'''Runs the benchmark scenarios against synthetic repositories and a local
+stub Review Board server, and writes the timings as JSON so that runs can
+be compared to catch regressions.
+
+For each kind of repository made by synthrepo (deep, wide, huge and
+branches) an upstream clone without the last --outgoing changesets is
+made as well, and these scenarios are timed:
+
+    getdiff      computing the diff of the tip in the calling process
+    getdiffs     computing it with the diff workers (reviewboard.diff_workers)
+    discovery    finding the changesets missing from the upstream clone
+    upload       posting the diff of the tip to the stub server
+    postreview   "hg postreview -O UPSTREAM -p" end to end, against a stub
+                 server with the 2.0 API and against one with the 1.0 API
+    memory       the same post in a process of its own (see bench_memory),
+                 checking that it raises the peak resident memory by at
+                 most --memory-budget times the size of the diff, plus
+                 --memory-slack MB for the fixed costs
+
+The stub server adds --latency seconds to every request and limits bodies
+to --bandwidth bytes per second.  The diff and discovery caches are
+disabled, so every iteration does the full work.  The exit status is 1 if
+a post goes over its memory budget.
+
+    python -m mercurial_reviewboard.tests.benchmarks.bench_suite \\
+        --output results.json
+'''
+
+import json
+import optparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from mercurial import fancyopts, hg, ui as uimod, util
+
+from mercurial_reviewboard import (cmdtable, findoutgoing, getdiff, getdiffs,
+                                   postreview)
+from mercurial_reviewboard.reviewboard import Api20Client, HttpClient
+from mercurial_reviewboard.tests.benchmarks import synthrepo
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+# arguments of the synthrepo generators at --scale 1
+SIZES = {
+    'deep': lambda scale: {'changesets': int(2000 * scale)},
+    'wide': lambda scale: {'files': int(2000 * scale)},
+    'huge': lambda scale: {'size': int(20 * 1024 * 1024 * scale)},
+    'branches': lambda scale: {'count': int(50 * scale)},
+}
+
+
+def make_ui(server):
+    ui = uimod.ui()
+    ui.setconfig('reviewboard', 'server', server.url)
+    ui.setconfig('reviewboard', 'user', 'bench')
+    ui.setconfig('reviewboard', 'password', 'bench')
+    ui.setconfig('reviewboard', 'launch_webbrowser', 'false')
+    ui.setconfig('reviewboard', 'cache', 'false')
+    ui.setconfig('reviewboard', 'diff_cache', 'false')
+    return ui
+
+
+def postreview_opts(**opts):
+    initial = {}
+    fancyopts.fancyopts([], cmdtable['postreview'][1], initial)
+    initial.update(opts)
+    return initial
+
+
+class Suite:
+
+    def __init__(self, opts, directory):
+        self.opts = opts
+        self.directory = directory
+        self.results = []
+
+    def measure(self, scenario, name, fn, server=None):
+        '''time fn over the iterations and record the result'''
+        times = []
+        requests = sent = 0
+        for i in range(self.opts.iterations):
+            if server is not None:
+                del server.requests[:]
+            start = time.time()
+            fn()
+            times.append(time.time() - start)
+            if server is not None:
+                requests = len(server.requests)
+                sent = sum([size for method, path, size in server.requests])
+        result = {'scenario': scenario, 'repo': name,
+                  'iterations': len(times),
+                  'mean': sum(times) / len(times), 'min': min(times),
+                  'max': max(times)}
+        if server is not None:
+            result['requests'] = requests
+            result['sent'] = sent
+        self.results.append(result)
+        sys.stderr.write('%-12s %-10s %9.3f s (min %.3f s)\n'
+                         % (scenario, name, result['mean'], result['min']))
+
+    def memory(self, name, server, path, upstream, size):
+        '''check the memory a post of a diff of size bytes takes'''
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__)))))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [root] + [p for p in [env.get('PYTHONPATH')] if p])
+        child = subprocess.Popen(
+            [sys.executable, '-m',
+             'mercurial_reviewboard.tests.benchmarks.bench_memory',
+             server.url, path, upstream], stdout=subprocess.PIPE, env=env)
+        output = child.communicate()[0]
+        if child.returncode:
+            raise RuntimeError('bench_memory failed on %s' % name)
+        raised = json.loads(output.splitlines()[-1])['raised']
+        budget = (self.opts.memory_budget * size +
+                  self.opts.memory_slack * 1024 * 1024)
+        result = {'scenario': 'memory', 'repo': name, 'diff': size,
+                  'raised': raised, 'budget': budget,
+                  'ok': raised <= budget}
+        self.results.append(result)
+        sys.stderr.write('%-12s %-10s %9.1f MB for a %.1f MB diff%s\n'
+                         % ('memory', name, raised / 1048576.0,
+                            size / 1048576.0,
+                            not result['ok'] and ', OVER BUDGET' or ''))
+
+    def run(self, name):
+        opts = self.opts
+        path = os.path.join(self.directory, name)
+        kwargs = SIZES[name](opts.scale)
+        repo = synthrepo.generators[name](path, **kwargs)
+        upstream = os.path.join(self.directory, name + '-upstream')
+        rev = max(0, len(repo) - 1 - opts.outgoing)
+        hg.clone(repo.ui, {}, path, upstream, rev=[repo[rev].node()],
+                 update=False)
+
+        server = StubServer(latency=opts.latency, bandwidth=opts.bandwidth)
+        server.start()
+        server10 = StubServer(latency=opts.latency, bandwidth=opts.bandwidth,
+                              apiver='1.0')
+        server10.start()
+        try:
+            ui = make_ui(server)
+            repo = hg.repository(ui, path)
+            tip = repo['tip']
+            parent = tip.parents()[0]
+
+            self.measure('getdiff', name,
+                         lambda: getdiff(ui, repo, tip, parent).close())
+
+            workers_ui = ui.copy()
+            workers_ui.setconfig('reviewboard', 'diff_pool_min_size', '0')
+            if opts.workers:
+                workers_ui.setconfig('reviewboard', 'diff_workers',
+                                     str(opts.workers))
+            self.measure('getdiffs', name,
+                         lambda: getdiffs(workers_ui, repo, [(tip, parent)]))
+
+            self.measure('discovery', name,
+                         lambda: findoutgoing(repo,
+                                              hg.peer(ui, {}, upstream)))
+
+            diff = getdiff(ui, repo, tip, parent)
+            def upload():
+                httpclient = HttpClient(server.url)
+                Api20Client(httpclient).new_request('1', {}, diff)
+            self.measure('upload', name, upload, server)
+
+            for label, stub in (('postreview', server),
+                                ('postreview10', server10)):
+                postui = make_ui(stub)
+                postrepo = hg.repository(postui, path)
+                def post():
+                    postui.pushbuffer()
+                    try:
+                        postreview(postui, postrepo, 'tip',
+                                   **postreview_opts(outgoingrepo=upstream,
+                                                     repoid='1', publish=True))
+                    finally:
+                        postui.popbuffer()
+                self.measure(label, name, post, stub)
+
+            self.memory(name, server, path, upstream, len(diff))
+        finally:
+            server.stop()
+            server10.stop()
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--output', help='write the JSON results to this file '
+                      'instead of standard output')
+    parser.add_option('--repos', default='deep,wide,huge,branches',
+                      help='comma separated kinds of repository to run on')
+    parser.add_option('--scale', type='float', default=1.0,
+                      help='multiplies the size of the repositories')
+    parser.add_option('--outgoing', type='int', default=10,
+                      help='changesets missing from the upstream clone')
+    parser.add_option('--latency', type='float', default=0.02)
+    parser.add_option('--bandwidth', type='int', default=10 * 1024 * 1024,
+                      help='bytes per second, 0 for no limit')
+    parser.add_option('--workers', type='int', default=0,
+                      help='diff workers, one per CPU by default')
+    parser.add_option('--iterations', type='int', default=3)
+    # mercurial diffs a file with both versions and their lines in memory,
+    # which takes some five times the size of a diff rewriting large files
+    parser.add_option('--memory-budget', type='float', default=6.0,
+                      help='most memory a post may take, in multiples of '
+                      'the size of its diff')
+    parser.add_option('--memory-slack', type='float', default=32,
+                      help='MB a post may take on top of its budget')
+    opts, args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-suite-')
+    # the cookie file of the HTTP client goes to the home directory
+    home = os.environ.get('HOME')
+    os.environ['HOME'] = directory
+    # make_rbclient prints to standard output, keep it for the results
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        suite = Suite(opts, directory)
+        for name in opts.repos.split(','):
+            suite.run(name.strip())
+    finally:
+        sys.stdout = stdout
+        if home is not None:
+            os.environ['HOME'] = home
+        shutil.rmtree(directory)
+
+    report = {'time': time.time(),
+              'python': sys.version.split()[0],
+              'mercurial': util.version(),
+              'options': vars(opts),
+              'results': suite.results}
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if opts.output:
+        fp = open(opts.output, 'w')
+        try:
+            fp.write(data + '\n')
+        finally:
+            fp.close()
+    else:
+        print data
+
+    over = [r for r in suite.results if r.get('ok') is False]
+    if over:
+        sys.stderr.write('over the memory budget: %s\n'
+                         % ', '.join([r['repo'] for r in over]))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+'''Creates synthetic repositories for the benchmarks.
+
+Changesets are committed in memory with memctx, without a working
+directory, so that repositories with thousands of changesets or files can
+be created in seconds.  Every generator takes the path of a new repository
+and returns it; the contents depend only on the arguments, so the same
+arguments always give the same changesets.
+
+    deep      a long linear history changing a few files each time
+    wide      a single changeset changing thousands of files
+    huge      a few very large files rewritten by the last changeset
+    branches  many named branches of a few changesets each
+'''
+
+from mercurial import context, hg, ui as uimod
+from mercurial.node import nullid
+
+
+def text(name, lines, version):
+    return ''.join(['line %d of %s, version %d\n' % (i, name, version + i % 7)
+                    for i in range(lines)])
+
+
+def commit(repo, parent, files, message, branch='default'):
+    '''commit files, a dictionary of path to contents, on top of parent'''
+    def filectxfn(repo, memctx, path):
+        return context.memfilectx(path, files[path])
+    ctx = context.memctx(repo, (parent, nullid), message, sorted(files),
+                         filectxfn, 'bench <bench@example.com>',
+                         '0 0', {'branch': branch})
+    return repo.commitctx(ctx)
+
+
+def create(path):
+    ui = uimod.ui()
+    ui.setconfig('ui', 'quiet', 'true')
+    return hg.repository(ui, path, create=True)
+
+
+def deep(path, changesets=2000, files=100, lines=20):
+    repo = create(path)
+    node = nullid
+    node = commit(repo, node, dict([('file%04d.txt' % i,
+                                     text('file%04d' % i, lines, 0))
+                                    for i in range(files)]), 'base')
+    for n in range(1, changesets):
+        name = 'file%04d.txt' % (n % files)
+        node = commit(repo, node, {name: text(name, lines, n)},
+                      'change %d' % n)
+    return hg.repository(repo.ui, path)
+
+
+def wide(path, files=5000, lines=20):
+    repo = create(path)
+    names = ['dir%02d/file%05d.txt' % (i % 50, i) for i in range(files)]
+    node = commit(repo, nullid, dict([(name, text(name, lines, 0))
+                                      for name in names]), 'base')
+    commit(repo, node, dict([(name, text(name, lines, 1)) for name in names]),
+           'rewrite everything')
+    return hg.repository(repo.ui, path)
+
+
+def huge(path, files=2, size=20 * 1024 * 1024):
+    repo = create(path)
+    lines = size / 40
+    names = ['huge%d.txt' % i for i in range(files)]
+    node = commit(repo, nullid, dict([(name, text(name, lines, 0))
+                                      for name in names]), 'base')
+    commit(repo, node, dict([(name, text(name, lines, 1)) for name in names]),
+           'rewrite the huge files')
+    return hg.repository(repo.ui, path)
+
+
+def branches(path, count=50, depth=5, lines=20):
+    repo = create(path)
+    base = commit(repo, nullid, {'common.txt': text('common', lines, 0)},
+                  'base')
+    for b in range(count):
+        node = base
+        for n in range(depth):
+            name = 'branch%03d.txt' % b
+            node = commit(repo, node, {name: text(name, lines, n)},
+                          'change %d on branch %d' % (n, b),
+                          branch='branch%03d' % b)
+    return hg.repository(repo.ui, path)
+
+
+generators = {
+    'deep': deep,
+    'wide': wide,
+    'huge': huge,
+    'branches': branches,
+}
@@ -0,0 +1,316 @@
+'''A local stand-in for a Review Board server, used by the tests and the
+benchmarks to exercise the HTTP code without a real server.'''
+
+import BaseHTTPServer
+import SocketServer
+import hashlib
+import json
+import re
+import threading
+import time
+import zlib
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''Serves the parts of the Review Board 1.0 and 2.0 web APIs that the
+    extension uses.  With apiver '1.0' only the 1.0 API is served, like an
+    old server that has no /api/ root resource.
+
+    connect_latency is slept once for every new connection, which stands in
+    for the TCP and TLS handshakes with a remote server.  latency is slept
+    for every request.  With bandwidth, sending a request or response body
+    of n bytes takes n / bandwidth seconds more.  With accept_gzip the
+    server announces that it takes gzip compressed request bodies,
+    otherwise it rejects them with 415.'''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_latency=0, latency=0, repositories=None,
+                 accept_gzip=False, bandwidth=None, apiver='2.0'):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           StubRequestHandler)
+        self.url = 'http://127.0.0.1:%d/' % self.server_port
+        self.connect_latency = connect_latency
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.apiver = apiver
+        self.accept_gzip = accept_gzip
+        self.repositories = repositories or [
+            {'id': 1, 'name': 'repo', 'tool': 'Mercurial',
+             'path': 'http://hg.example.org/repo'}]
+        self.review_requests = {}
+        # (method, path, request body size) for every request served, the
+        # size is that of the body as it was sent
+        self.requests = []
+        # the decoded bodies of the diffs uploaded
+        self.diffs = []
+        self.connections = 0
+        # requests being served now, and the most there have been at once
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.setDaemon(True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def log(self, method, path, size):
+        self._lock.acquire()
+        try:
+            self.requests.append((method, path, size))
+        finally:
+            self._lock.release()
+
+    def enter(self):
+        self._lock.acquire()
+        try:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        finally:
+            self._lock.release()
+
+    def leave(self):
+        self._lock.acquire()
+        try:
+            self.active -= 1
+        finally:
+            self._lock.release()
+
+    def transfer(self, size):
+        '''stands in for the time taken to send size bytes'''
+        if self.bandwidth and size:
+            time.sleep(float(size) / self.bandwidth)
+
+    def new_review_request(self, repository):
+        self._lock.acquire()
+        try:
+            id = len(self.review_requests) + 1
+            self.review_requests[id] = {'id': id, 'repository': repository,
+                                        'public': False, 'diffs': 0,
+                                        'summary': '', 'draft': {}}
+            return id
+        finally:
+            self._lock.release()
+
+
+class StubRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # buffer responses like a real server does, unbuffered writes of the
+    # status line and headers interact badly with delayed ACKs
+    wbufsize = -1
+
+    routes = [
+        ('GET',  r'^/api/$', 'root'),
+        ('GET',  r'^/api/repositories/$', 'repositories'),
+        ('GET',  r'^/api/review-requests/$', 'review_requests'),
+        ('POST', r'^/api/review-requests/$', 'create'),
+        ('GET',  r'^/api/review-requests/(\d+)/$', 'review_request'),
+        ('PUT',  r'^/api/review-requests/(\d+)/draft/$', 'draft'),
+        ('POST', r'^/api/review-requests/(\d+)/diffs/$', 'diff'),
+    ]
+
+    routes10 = [
+        ('POST', r'^/api/json/accounts/login/$', 'login10'),
+        ('POST', r'^/api/json/repositories/$', 'repositories10'),
+        ('POST', r'^/api/json/reviewrequests/all/$', 'review_requests10'),
+        ('POST', r'^/api/json/reviewrequests/new/$', 'create10'),
+        ('POST', r'^/api/json/reviewrequests/(\d+)/draft/set/$', 'draft10'),
+        ('POST', r'^/api/json/reviewrequests/(\d+)/diff/new/$', 'diff'),
+        ('POST', r'^/api/json/reviewrequests/(\d+)/publish/$', 'publish10'),
+    ]
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server._lock.acquire()
+        try:
+            self.server.connections += 1
+        finally:
+            self.server._lock.release()
+        if self.server.connect_latency:
+            time.sleep(self.server.connect_latency)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def _dispatch(self, method):
+        self.server.enter()
+        try:
+            self._serve(method)
+        finally:
+            self.server.leave()
+
+    def _serve(self, method):
+        length = int(self.headers.getheader('content-length') or 0)
+        self.body = self.rfile.read(length)
+        path, query = (self.path.split('?', 1) + [''])[:2]
+        self.query = dict([p.split('=', 1) for p in query.split('&')
+                           if '=' in p])
+        self.server.log(method, path, length)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.server.transfer(length)
+
+        if self.headers.getheader('content-encoding') == 'gzip':
+            if not self.server.accept_gzip:
+                self._respond(415, {'stat': 'fail', 'err': {
+                    'code': 415, 'msg': 'Unsupported Media Type'}})
+                return
+            self.body = zlib.decompress(self.body, 16 + zlib.MAX_WBITS)
+
+        routes = self.routes10
+        if self.server.apiver == '2.0':
+            routes = self.routes + routes
+        for routemethod, pattern, name in routes:
+            m = re.match(pattern, path)
+            if m and routemethod == method:
+                status, rsp = getattr(self, 'do_' + name)(*m.groups())
+                break
+        else:
+            status, rsp = 404, {'stat': 'fail',
+                                'err': {'code': 100, 'msg': 'Not found'}}
+        self._respond(status, rsp, etag=(method == 'GET'))
+
+    def _respond(self, status, rsp, etag=False):
+        data = json.dumps(rsp, sort_keys=True)
+        headers = {'Content-Type': 'application/json'}
+        if self.server.accept_gzip:
+            headers['Accept-Encoding'] = 'gzip'
+        if etag and status == 200:
+            headers['ETag'] = '"%s"' % hashlib.md5(data).hexdigest()
+            if self.headers.getheader('if-none-match') == headers['ETag']:
+                status, data = 304, ''
+        headers['Content-Length'] = str(len(data))
+        self.server.transfer(len(data))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _href(self, path):
+        return {'href': self.server.url + path.lstrip('/'), 'method': 'GET'}
+
+    def _review_request(self, id):
+        rr = self.server.review_requests[id]
+        base = 'api/review-requests/%s/' % id
+        return {'id': id, 'summary': rr['summary'], 'public': rr['public'],
+                'links': {'self': self._href(base),
+                          'draft': self._href(base + 'draft/'),
+                          'diffs': self._href(base + 'diffs/')}}
+
+    def do_root(self):
+        return 200, {'stat': 'ok',
+                     'links': {'repositories': self._href('api/repositories/'),
+                               'review_requests':
+                                   self._href('api/review-requests/')},
+                     'uri_templates': {
+                         'repositories':
+                             self.server.url + 'api/repositories/',
+                         'review_requests':
+                             self.server.url + 'api/review-requests/',
+                         'review_request': self.server.url +
+                             'api/review-requests/{review_request_id}/'}}
+
+    def _page(self, path, key, items):
+        start = int(self.query.get('start', 0))
+        maxresults = int(self.query.get('max-results', 25))
+        rsp = {'stat': 'ok', 'total_results': len(items),
+               key: items[start:start + maxresults], 'links': {}}
+        if start + maxresults < len(items):
+            rsp['links']['next'] = self._href(
+                '%s?start=%d&max-results=%d'
+                % (path, start + maxresults, maxresults))
+        return 200, rsp
+
+    def do_repositories(self):
+        return self._page('api/repositories/', 'repositories',
+                          self.server.repositories)
+
+    def do_review_requests(self):
+        ids = sorted(self.server.review_requests)
+        return self._page('api/review-requests/', 'review_requests',
+                          [self._review_request(id) for id in ids])
+
+    def do_create(self):
+        id = self.server.new_review_request(None)
+        return 201, {'stat': 'ok', 'review_request': self._review_request(id)}
+
+    def _missing(self, id):
+        if int(id) not in self.server.review_requests:
+            return 404, {'stat': 'fail',
+                         'err': {'code': 100, 'msg': 'Object does not exist'}}
+        return None
+
+    def do_review_request(self, id):
+        missing = self._missing(id)
+        if missing:
+            return missing
+        return 200, {'stat': 'ok',
+                     'review_request': self._review_request(int(id))}
+
+    def do_draft(self, id):
+        missing = self._missing(id)
+        if missing:
+            return missing
+        rr = self.server.review_requests[int(id)]
+        if 'name="public"' in self.body:
+            rr['public'] = True
+        return 200, {'stat': 'ok', 'draft': {'id': int(id)}}
+
+    def do_diff(self, id):
+        missing = self._missing(id)
+        if missing:
+            return missing
+        rr = self.server.review_requests[int(id)]
+        rr['diffs'] += 1
+        self.server.diffs.append(self.body)
+        return 201, {'stat': 'ok', 'diff': {'id': rr['diffs']}}
+
+    # the 1.0 API, which takes every call as a POST of form fields
+
+    def do_login10(self):
+        return 200, {'stat': 'ok'}
+
+    def do_repositories10(self):
+        return 200, {'stat': 'ok', 'repositories': self.server.repositories}
+
+    def do_review_requests10(self):
+        ids = sorted(self.server.review_requests)
+        return 200, {'stat': 'ok',
+                     'review_requests': [self._review_request(id)
+                                         for id in ids]}
+
+    def do_create10(self):
+        id = self.server.new_review_request(None)
+        return 200, {'stat': 'ok', 'review_request': self._review_request(id)}
+
+    def do_draft10(self, id):
+        missing = self._missing(id)
+        if missing:
+            return missing
+        return 200, {'stat': 'ok'}
+
+    def do_publish10(self, id):
+        missing = self._missing(id)
+        if missing:
+            return missing
+        self.server.review_requests[int(id)]['public'] = True
+        return 200, {'stat': 'ok'}
@@ -0,0 +1,48 @@
+import shutil
+import tempfile
+import time
+
+from mock import patch
+from nose.tools import eq_
+
+from mercurial_reviewboard.reviewboard import (Api10Client, HttpClient,
+                                               make_rbclient)
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+
+class TestApi10:
+
+    def setup(self):
+        self.server = StubServer(apiver='1.0').start()
+        self.home = tempfile.mkdtemp()
+
+    def teardown(self):
+        self.server.stop()
+        shutil.rmtree(self.home)
+
+    @patch('mercurial_reviewboard.reviewboard.homepath')
+    def test_detected_and_posts(self, mock_homepath):
+        mock_homepath.return_value = self.home
+        client = make_rbclient(self.server.url, 'foo', 'bar')
+        assert isinstance(client, Api10Client)
+        eq_(['repo'], [r.name for r in client.repositories()])
+        id = client.new_request('1', {'summary': 'x'}, 'diff', publish=True)
+        client.update_request(id, {}, 'diff 2')
+        eq_(2, self.server.review_requests[id]['diffs'])
+        assert self.server.review_requests[id]['public']
+
+
+def test_bandwidth():
+    server = StubServer(bandwidth=100 * 1024).start()
+    try:
+        httpclient = HttpClient(server.url)
+        httpclient.cookie_file = '/dev/null'
+        server.new_review_request(1)
+        start = time.time()
+        httpclient.api_request('POST', '/api/review-requests/1/diffs/', {},
+                               {'path': {'filename': 'diff',
+                                         'content': 'x' * 20 * 1024}})
+        # 20 KB at 100 KB/s
+        assert time.time() - start >= 0.2
+    finally:
+        server.stop()
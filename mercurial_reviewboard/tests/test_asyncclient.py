@@ -0,0 +1,45 @@
+from nose.tools import eq_, raises
+
+from mercurial_reviewboard.asyncclient import AsyncApiClient, results
+from mercurial_reviewboard.reviewboard import (Api20Client, ConnectionPool,
+    HttpClient, ReviewBoardError)
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+
+class TestAsyncApiClient:
+
+    def setup(self):
+        self.server = StubServer(latency=0.05).start()
+        httpclient = HttpClient(self.server.url, pool=ConnectionPool())
+        httpclient.cookie_file = '/dev/null'
+        self.client = AsyncApiClient(Api20Client(httpclient), workers=8,
+                                     maxcalls=3)
+
+    def teardown(self):
+        self.client.shutdown()
+        self.server.stop()
+
+    def test_concurrent_requests(self):
+        ids = results([self.client.new_request('1') for i in range(6)])
+        eq_(range(1, 7), sorted(ids))
+        # the calls overlap, three at a time
+        eq_(3, self.server.max_active)
+        eq_(3, self.server.connections)
+
+    def test_update_and_publish(self):
+        id = self.client.new_request('1').result()
+        self.client.update_request(id, {'summary': 'x'}, 'diff').result()
+        self.client.publish(id).result()
+        eq_(1, self.server.review_requests[id]['diffs'])
+        assert self.server.review_requests[id]['public']
+
+    def test_lists(self):
+        repositories, requests = results([self.client.repositories(),
+                                          self.client.pending_user_requests()])
+        eq_(['repo'], [r.name for r in repositories])
+        eq_([], requests)
+
+    @raises(ReviewBoardError)
+    def test_error(self):
+        self.client.update_request(42, {'summary': 'x'}).result()
+
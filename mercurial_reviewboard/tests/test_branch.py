@@ -15,4 +15,4 @@ def test_branch(mock_send):
     postreview(ui, repo, **opts)
     
     expected = open('mercurial_reviewboard/tests/diffs/branch', 'r').read()
-    eq_(expected, mock_send.call_args[0][4])
\ No newline at end of file
+    eq_(expected, mock_send.call_args[0][4].getvalue())
\ No newline at end of file
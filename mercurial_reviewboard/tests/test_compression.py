@@ -0,0 +1,101 @@
+import zlib
+
+from nose.tools import eq_
+
+from mercurial_reviewboard.diffbuffer import spooldiff
+from mercurial_reviewboard.reviewboard import (Api20Client, GzipBody,
+                                               HttpClient, MultipartBody,
+                                               accepts_encoding)
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+
+def make_diff(lines=5000):
+    return ''.join(['+line %d of a diff that compresses well\n' % i
+                    for i in range(lines)])
+
+
+def test_gzip_body():
+    diff = make_diff()
+    files = {'path': {'filename': 'diff', 'content': spooldiff([diff])}}
+    raw = MultipartBody('boundary', {}, files)
+    body = GzipBody(raw, spool_size=1024)
+    eq_(len(raw), body.rawlength)
+    assert len(body) < len(raw) / 10
+
+    data = body.read()
+    eq_(len(body), len(data))
+    raw.rewind()
+    eq_(raw.read(), zlib.decompress(data, 16 + zlib.MAX_WBITS))
+
+    # the body can be sent again, e.g. after an authentication challenge
+    body.rewind()
+    eq_(data, body.read(100) + body.read())
+
+
+def test_accepts_encoding():
+    assert accepts_encoding('gzip', 'gzip')
+    assert accepts_encoding('deflate, GZIP', 'gzip')
+    assert accepts_encoding('*', 'gzip')
+    assert accepts_encoding('gzip;q=0.5', 'gzip')
+    assert not accepts_encoding('gzip;q=0', 'gzip')
+    assert not accepts_encoding('identity', 'gzip')
+    assert not accepts_encoding(None, 'gzip')
+
+
+class TestCompressedUpload:
+
+    def setup(self):
+        self.server = None
+
+    def teardown(self):
+        self.server.stop()
+
+    def post(self, compress_uploads=True, **kwargs):
+        self.server = StubServer(**kwargs).start()
+        httpclient = HttpClient(self.server.url,
+                                compress_uploads=compress_uploads)
+        httpclient.cookie_file = '/dev/null'
+        self.diff = make_diff()
+        client = Api20Client(httpclient)
+        client.new_request('1', {}, spooldiff([self.diff]))
+        return httpclient
+
+    def diff_requests(self):
+        return [r for r in self.server.requests if r[1].endswith('/diffs/')]
+
+    def test_compressed(self):
+        httpclient = self.post(accept_gzip=True)
+        assert httpclient.accepts_gzip
+        size = self.diff_requests()[0][2]
+        assert size < len(self.diff) / 10
+        assert self.diff in self.server.diffs[0]
+
+    def test_not_supported(self):
+        httpclient = self.post(accept_gzip=False)
+        assert not httpclient.accepts_gzip
+        eq_(1, len(self.diff_requests()))
+        assert self.diff_requests()[0][2] > len(self.diff)
+
+    def test_disabled(self):
+        httpclient = self.post(compress_uploads=False, accept_gzip=True)
+        eq_(None, httpclient.accepts_gzip)
+        eq_(['/api/review-requests/', '/api/review-requests/1/diffs/'],
+            [r[1] for r in self.server.requests])
+
+    def test_rejected(self):
+        self.server = StubServer(accept_gzip=True).start()
+        httpclient = HttpClient(self.server.url, compress_uploads=True)
+        httpclient.cookie_file = '/dev/null'
+        httpclient.api_request('GET', '/api/')
+        assert httpclient.accepts_gzip
+
+        # the server changes its mind, the upload is sent again as it is
+        self.server.accept_gzip = False
+        diff = make_diff()
+        Api20Client(httpclient).new_request('1', {}, spooldiff([diff]))
+        requests = [r for r in self.server.requests
+                    if r[1].endswith('/diffs/')]
+        eq_(2, len(requests))
+        assert requests[0][2] < requests[1][2]
+        assert diff in self.server.diffs[0]
+        assert not httpclient.accepts_gzip
@@ -0,0 +1,93 @@
+import httplib
+import time
+
+from nose.tools import assert_raises, eq_
+
+from mercurial_reviewboard.reviewboard import (ConnectionPool, HttpClient,
+                                               ReviewBoardError)
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+
+class TestConnectionPool:
+
+    def setup(self):
+        self.server = StubServer().start()
+
+    def teardown(self):
+        self.server.stop()
+
+    def make_client(self, **kwargs):
+        client = HttpClient(self.server.url, pool=ConnectionPool(**kwargs))
+        client.cookie_file = '/dev/null'
+        return client
+
+    def test_connection_reused(self):
+        client = self.make_client()
+        client.api_request('GET', '/api/')
+        client.api_request('POST', '/api/review-requests/', {'repository': '1'})
+        client.api_request('PUT', '/api/review-requests/1/draft/',
+                           {'public': '1'})
+        eq_(3, len(self.server.requests))
+        eq_(1, self.server.connections)
+        eq_(1, client.pool.opened)
+        assert self.server.review_requests[1]['public']
+
+    def test_no_pooling(self):
+        client = self.make_client(maxsize=0)
+        client.api_request('GET', '/api/')
+        client.api_request('GET', '/api/')
+        eq_(2, self.server.connections)
+
+    def test_idle_timeout(self):
+        client = self.make_client(idle_timeout=0.05)
+        client.api_request('GET', '/api/')
+        time.sleep(0.1)
+        client.api_request('GET', '/api/')
+        eq_(2, client.pool.opened)
+
+    def test_closed_connection_is_replaced(self):
+        client = self.make_client()
+        client.api_request('GET', '/api/')
+        # simulate the server dropping the idle connection
+        for key, conn, used in client.pool._idle:
+            conn.sock.close()
+        rsp = client.api_request('GET', '/api/repositories/')
+        eq_('repo', rsp['repositories'][0]['name'])
+        eq_(2, client.pool.opened)
+
+    def test_post_on_dropped_connection(self):
+        client = self.make_client()
+        client.api_request('GET', '/api/')
+        for key, conn, used in client.pool._idle:
+            conn.sock.close()
+        client.api_request('POST', '/api/review-requests/', {'repository': '1'})
+        eq_(1, len(self.server.review_requests))
+        eq_(2, client.pool.opened)
+
+    def test_post_not_sent_twice(self):
+        client = self.make_client()
+        client.api_request('GET', '/api/')
+        # the connection fails once the request is out, the server may
+        # have created the review request already
+        def getresponse():
+            raise httplib.BadStatusLine('')
+        for key, conn, used in client.pool._idle:
+            conn.getresponse = getresponse
+        assert_raises(ReviewBoardError, client.api_request, 'POST',
+                      '/api/review-requests/', {'repository': '1'})
+        # the server handles the request on a thread of its own
+        deadline = time.time() + 2
+        while not self.server.review_requests and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        eq_(1, len(self.server.review_requests))
+
+    def test_get_sent_again(self):
+        client = self.make_client()
+        client.api_request('GET', '/api/')
+        def getresponse():
+            raise httplib.BadStatusLine('')
+        for key, conn, used in client.pool._idle:
+            conn.getresponse = getresponse
+        rsp = client.api_request('GET', '/api/repositories/')
+        eq_('repo', rsp['repositories'][0]['name'])
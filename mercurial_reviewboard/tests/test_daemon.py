@@ -0,0 +1,177 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+from mock import Mock, patch
+from nose.tools import eq_, raises
+
+from mercurial_reviewboard import daemon, getreviewboard, postreview
+from mercurial_reviewboard.diffbuffer import spooldiff
+from mercurial_reviewboard.errors import ReviewBoardError
+from mercurial_reviewboard.reviewboard import (Api10Client, Api20Client,
+                                               HttpClient)
+from mercurial_reviewboard.tests import get_initial_opts, mock_ui
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+
+class TestSessionServer:
+
+    apiver = '2.0'
+
+    def setup(self):
+        self.server = StubServer(apiver=self.apiver).start()
+        httpclient = HttpClient(self.server.url)
+        httpclient.cookie_file = '/dev/null'
+        if self.apiver == '1.0':
+            client = Api10Client(httpclient)
+        else:
+            client = Api20Client(httpclient)
+        self.directory = tempfile.mkdtemp()
+        self.path = daemon.socket_path(self.directory, self.server.url, 'foo')
+        self.session = daemon.SessionServer(client,
+                                            daemon.listen(self.path),
+                                            self.path, idle_timeout=0.5)
+        self.thread = threading.Thread(target=self.session.serve)
+        self.thread.start()
+        self.client = daemon.connect(self.path)
+
+    def teardown(self):
+        self.thread.join()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_post(self):
+        diff = spooldiff(['diff -r 000000000000 a\n', '+x\n'], 8)
+        id = self.client.new_request('1', {'summary': 'caf\xc3\xa9'}, diff,
+                                     publish=True)
+        eq_(1, id)
+        assert self.server.review_requests[1]['public']
+        assert 'diff -r 000000000000 a\n+x\n' in self.server.diffs[0]
+        self.client.update_request(id, {'summary': 'y'}, 'diff -r 1 b\n')
+        eq_(2, self.server.review_requests[1]['diffs'])
+
+    def test_repositories(self):
+        repositories = self.client.repositories()
+        eq_([r['name'] for r in self.server.repositories],
+            [r.name for r in repositories])
+        eq_(None, self.client.find_repository('/no/such/repository'))
+
+    def test_stop(self):
+        self.client.stop()
+        self.thread.join(0.3)
+        assert not self.thread.isAlive()
+        assert not os.path.exists(self.path)
+
+    @raises(ReviewBoardError)
+    def test_errors(self):
+        self.client.publish(99)
+
+    def test_idle_timeout(self):
+        self.thread.join(5)
+        assert not self.thread.isAlive()
+        assert not os.path.exists(self.path)
+        eq_(None, daemon.connect(self.path))
+
+
+class TestSessionServer10(TestSessionServer):
+
+    apiver = '1.0'
+
+    def test_update_after_listing(self):
+        # the daemon's client must not answer from a listing made before
+        # the request was created
+        first = self.client.new_request('1', {'summary': 'x'}, 'diff')
+        self.client.update_request(first, {'summary': 'y'})
+        second = self.client.new_request('1', {'summary': 'x'}, 'diff')
+        self.client.update_request(second, {}, 'diff 2')
+        eq_(2, self.server.review_requests[second]['diffs'])
+
+    def test_error_reaches_client(self):
+        # the daemon answers as soon as it has the call, which must not
+        # turn into a broken pipe on the empty parent diff
+        for i in range(5):
+            try:
+                self.client.update_request(99, {}, 'diff')
+            except ReviewBoardError, e:
+                assert "can't find request with id: 99" in str(e), str(e)
+            else:
+                assert False, 'no error'
+
+
+def test_forget_only_when_idle():
+    client = Mock()
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'daemon.sock')
+        session = daemon.SessionServer(client, daemon.listen(path), path)
+        message = {'method': 'publish', 'args': [1], 'kwargs': {}}
+        # another call is using the client
+        session._calls = 1
+        session._dispatch(message, [])
+        assert not client.forget.called
+        session._calls = 0
+        session._dispatch(message, [])
+        eq_(1, client.forget.call_count)
+        eq_(2, client.publish.call_count)
+        session.listener.close()
+        for fd in session._wakeup:
+            os.close(fd)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_connect_removes_stale_socket():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'daemon.sock')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.close()
+        eq_(None, daemon.connect(path))
+        assert not os.path.exists(path)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_socket_per_server_and_user():
+    paths = set([daemon.socket_path('/tmp', server, user)
+                 for server in ('http://a/', 'http://b/')
+                 for user in ('foo', 'bar')])
+    eq_(4, len(paths))
+
+
+@patch('mercurial_reviewboard.daemon.start')
+@patch('mercurial_reviewboard.daemon.connect')
+@patch('mercurial_reviewboard.getcache')
+@patch('mercurial_reviewboard.make_rbclient')
+def test_starts_daemon(mock_make_rbclient, mock_getcache, mock_connect,
+                       mock_start):
+    mock_connect.return_value = None
+    opts = get_initial_opts()
+    opts['daemon'] = True
+    eq_(mock_start.return_value, getreviewboard(mock_ui(), opts))
+    eq_(mock_make_rbclient.return_value, mock_start.call_args[0][0])
+
+
+@patch('mercurial_reviewboard.daemon.start')
+@patch('mercurial_reviewboard.daemon.connect')
+@patch('mercurial_reviewboard.make_rbclient')
+def test_uses_running_daemon(mock_make_rbclient, mock_connect, mock_start):
+    ui = mock_ui()
+    ui.setconfig('reviewboard', 'use_daemon', 'true')
+    eq_(mock_connect.return_value, getreviewboard(ui, get_initial_opts()))
+    assert not mock_make_rbclient.called
+    assert not mock_start.called
+
+
+@patch('mercurial_reviewboard.daemon.connect')
+@patch('mercurial_reviewboard.make_rbclient')
+def test_daemon_stop_option(mock_make_rbclient, mock_connect):
+    ui = mock_ui()
+    opts = get_initial_opts()
+    opts['daemon_stop'] = True
+    postreview(ui, None, **opts)
+    assert mock_connect.return_value.stop.called
+    assert not mock_make_rbclient.called
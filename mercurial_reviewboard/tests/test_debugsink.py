@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+
+from mock import Mock, patch
+from nose.tools import eq_, with_setup
+
+from mercurial_reviewboard import postreview
+from mercurial_reviewboard.debugsink import DiffSink, debug
+from mercurial_reviewboard.diffbuffer import spooldiff
+from mercurial_reviewboard.tests import (forget_posts, get_initial_opts,
+                                         get_repo, mock_ui)
+
+
+class Unprintable:
+    def __str__(self):
+        raise AssertionError('formatted with --debug off')
+
+
+def test_debug_off_does_not_format():
+    ui = mock_ui()
+    debug(ui, 'value: %s\n', Unprintable())
+    debug(None, 'value: %s\n', Unprintable())
+    assert not ui.debug.called
+
+
+def test_debug_on():
+    ui = mock_ui()
+    ui.debugflag = True
+    debug(ui, 'value: %s of %d\n', 'x', 2)
+    debug(ui, 'no %s arguments\n')
+    eq_([(('value: x of 2\n',), {}), (('no %s arguments\n',), {})],
+        ui.debug.call_args_list)
+
+
+def test_dump():
+    directory = tempfile.mkdtemp()
+    try:
+        sink = DiffSink(os.path.join(directory, 'diffs'))
+        diff = spooldiff(['--- a\n', '+++ b\n'], 4)
+        path = sink.dump('1.diff', diff)
+        eq_(os.path.join(directory, 'diffs', '1.diff'), path)
+        eq_('--- a\n+++ b\n', open(path).read())
+        eq_('', open(sink.dump('2.diff', '')).read())
+    finally:
+        shutil.rmtree(directory)
+
+
+@with_setup(forget_posts, forget_posts)
+@patch('mercurial_reviewboard.getreviewboard')
+def test_dump_diffs_option(mock_getreviewboard):
+    mock_getreviewboard.return_value = Mock()
+    ui = mock_ui()
+    repo = get_repo(ui, 'two_revs')
+    directory = tempfile.mkdtemp()
+    try:
+        opts = get_initial_opts()
+        opts['dump_diffs'] = directory
+        opts['existing'] = '1'
+        postreview(ui, repo, **opts)
+        eq_(['%s.diff' % repo['.']], os.listdir(directory))
+        diff = open(os.path.join(directory, '%s.diff' % repo['.'])).read()
+        assert diff.startswith('diff -r '), diff
+    finally:
+        shutil.rmtree(directory)
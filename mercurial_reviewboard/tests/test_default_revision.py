@@ -13,7 +13,7 @@ def test_tip(mock_send):
     postreview(ui, repo, **opts)
     
     expected = open('mercurial_reviewboard/tests/diffs/two_revs_1', 'r').read()
-    eq_(expected, mock_send.call_args[0][4])
+    eq_(expected, mock_send.call_args[0][4].getvalue())
     
 @patch('mercurial_reviewboard.send_review')
 def test_not_tip(mock_send):
@@ -25,4 +25,4 @@ def test_not_tip(mock_send):
     
     expected = open('mercurial_reviewboard/tests/diffs/two_revs_0', 
                     'r').read()
-    eq_(expected, mock_send.call_args[0][4])
\ No newline at end of file
+    eq_(expected, mock_send.call_args[0][4].getvalue())
\ No newline at end of file
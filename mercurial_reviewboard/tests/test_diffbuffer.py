@@ -0,0 +1,28 @@
+from nose.tools import eq_
+
+from mercurial_reviewboard.diffbuffer import DiffBuffer, spooldiff
+
+
+def test_small_diff_stays_in_memory():
+    diff = spooldiff(['foo\n', 'bar\n'], spool_size=1024)
+    eq_(8, len(diff))
+    eq_('foo\nbar\n', diff.getvalue())
+    assert not diff._file._rolled
+
+
+def test_large_diff_spills_to_file():
+    diff = spooldiff(['x' * 10] * 10, spool_size=50)
+    eq_(100, len(diff))
+    assert diff._file._rolled
+    eq_('x' * 100, diff.getvalue())
+
+
+def test_chunks():
+    diff = spooldiff(['abcdefg'])
+    eq_(['abc', 'def', 'g'], list(diff.chunks(3)))
+    # reading again starts from the beginning
+    eq_(['abcdefg'], list(diff))
+
+
+def test_empty_diff_is_false():
+    assert not DiffBuffer()
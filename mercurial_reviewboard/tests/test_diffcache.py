@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+
+from mock import patch
+from nose.tools import eq_
+
+from mercurial_reviewboard import getdiffs
+from mercurial_reviewboard.diffbuffer import spooldiff
+from mercurial_reviewboard.diffcache import DiffCache
+from mercurial_reviewboard.tests import get_repo, mock_ui
+
+NODE1 = '\x01' * 20
+NODE2 = '\x02' * 20
+
+
+class TestDiffCache:
+
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'diffs')
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    def test_roundtrip(self):
+        cache = DiffCache(self.path)
+        key = cache.key(NODE1, NODE2)
+        eq_(None, cache.get(key))
+        diff = 'diff -r 01 -r 02 a\n' * 10000
+        cache.put(key, spooldiff([diff]))
+        eq_(diff, cache.get(key, spool_size=1024).getvalue())
+        eq_((1, 1), (cache.hits, cache.misses))
+        # stored compressed
+        assert os.path.getsize(os.path.join(self.path, key)) < len(diff) / 10
+
+    def test_key(self):
+        cache = DiffCache(self.path)
+        eq_(cache.key(NODE1, NODE2, [('quiet', False)]),
+            cache.key(NODE1, NODE2, [('quiet', False)]))
+        assert cache.key(NODE1, NODE2) != cache.key(NODE2, NODE1)
+        assert cache.key(NODE1, NODE2, [('quiet', False)]) != \
+            cache.key(NODE1, NODE2, [('quiet', True)])
+
+    def test_damaged_entry(self):
+        cache = DiffCache(self.path)
+        key = cache.key(NODE1, NODE2)
+        cache.put(key, 'diff')
+        open(os.path.join(self.path, key), 'wb').write('not zlib data')
+        eq_(None, cache.get(key))
+        assert not os.path.exists(os.path.join(self.path, key))
+
+    def test_least_recently_used_evicted(self):
+        cache = DiffCache(self.path, maxsize=3500)
+        keys = [cache.key(NODE1, chr(i) * 20) for i in range(3)]
+        for i, key in enumerate(keys):
+            # incompressible, about 1000 bytes each
+            cache.put(key, os.urandom(1000))
+            os.utime(os.path.join(self.path, key), (i, i))
+        # using the first entry makes the second the least recently used
+        assert cache.get(keys[0]) is not None
+        cache.put(cache.key(NODE2, NODE1), os.urandom(1000))
+        eq_([True, False, True], [cache.get(key) is not None for key in keys])
+
+
+class TestGetdiffsCache:
+
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.ui = mock_ui()
+        self.ui.setconfig('reviewboard', 'diff_cache_dir', self.dir)
+        self.ui.setconfig('reviewboard', 'diff_workers', '1')
+        self.repo = get_repo(self.ui, 'merge')
+        self.pairs = [(self.repo[5], self.repo[2]),
+                      (self.repo[2], self.repo[0])]
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    @patch('mercurial_reviewboard.getdiff')
+    def test_computed_once(self, mock_getdiff):
+        mock_getdiff.side_effect = lambda ui, repo, r, parent: \
+            spooldiff(['diff of %s against %s\n' % (r, parent)])
+        first = [d.getvalue() for d in getdiffs(self.ui, self.repo,
+                                                self.pairs)]
+        eq_(2, mock_getdiff.call_count)
+        second = [d.getvalue() for d in getdiffs(self.ui, self.repo,
+                                                 self.pairs)]
+        eq_(2, mock_getdiff.call_count)
+        eq_(first, second)
+
+    @patch('mercurial_reviewboard.getdiff')
+    def test_disabled(self, mock_getdiff):
+        mock_getdiff.return_value = spooldiff(['diff'])
+        self.ui.setconfig('reviewboard', 'diff_cache', 'false')
+        getdiffs(self.ui, self.repo, self.pairs)
+        getdiffs(self.ui, self.repo, self.pairs)
+        eq_(4, mock_getdiff.call_count)
+        eq_([], os.listdir(self.dir))
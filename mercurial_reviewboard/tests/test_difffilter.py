@@ -0,0 +1,112 @@
+from nose.tools import eq_
+
+from mercurial_reviewboard import create_reviews_data
+from mercurial_reviewboard.diffbuffer import spooldiff
+from mercurial_reviewboard.difffilter import DiffFilter, diffpath, lines
+from mercurial_reviewboard.tests import get_repo, mock_ui
+
+SMALL = ('diff -r 000000000000 -r 111111111111 src/small.py\n'
+         '--- a/src/small.py\n'
+         '+++ b/src/small.py\n'
+         '@@ -1,1 +1,1 @@\n'
+         '-a\n'
+         '+b\n')
+
+LARGE = ('diff -r 000000000000 -r 111111111111 data/large.txt\n'
+         '--- a/data/large.txt\n'
+         '+++ b/data/large.txt\n'
+         '@@ -0,0 +1,1000 @@\n' +
+         '+line\n' * 1000)
+
+BINARY = ('diff --git a/img/logo.png b/img/logo.png\n'
+          'new file mode 100644\n'
+          'GIT binary patch\n'
+          'literal 3\n'
+          'Kc${NkU|;|M00aO5\n')
+
+
+def filtered(difffilter, diff, omit=(), chunk_size=7):
+    # hand the diff over in small chunks that split lines
+    chunks = [diff[i:i + chunk_size] for i in range(0, len(diff), chunk_size)]
+    return ''.join(difffilter.filter(chunks, omit))
+
+
+def placeholder(header, path):
+    return header + 'Binary file %s has changed\n' % path
+
+
+def test_diffpath():
+    eq_('src/a file.py',
+        diffpath('diff -r 000000000000 -r 111111111111 src/a file.py\n'))
+    eq_('src/a.py', diffpath('diff -r 000000000000 src/a.py\n'))
+    eq_('img/logo.png', diffpath('diff --git a/img/logo.png b/img/logo.png\n'))
+
+
+def test_lines():
+    eq_(['a\n', 'bc\n', 'd'], list(lines(['a', '\nb', 'c\nd'])))
+
+
+def test_nothing_excluded():
+    difffilter = DiffFilter()
+    diff = SMALL + LARGE + BINARY
+    eq_(diff, filtered(difffilter, diff))
+    eq_([], difffilter.omitted)
+
+
+def test_excludes():
+    difffilter = DiffFilter(['*.txt', 'img/*'])
+    eq_(SMALL + placeholder(LARGE.splitlines(True)[0], 'data/large.txt') +
+        placeholder(BINARY.splitlines(True)[0], 'img/logo.png'),
+        filtered(difffilter, SMALL + LARGE + BINARY))
+    eq_(['data/large.txt', 'img/logo.png'],
+        [path for path, reason in difffilter.omitted])
+
+
+def test_glob_with_slash_matches_path():
+    difffilter = DiffFilter(['large.*', 'src/*'])
+    eq_([True, False],
+        [difffilter.matches('data/large.txt'),
+         difffilter.matches('lib/src/small.py')])
+
+
+def test_max_size():
+    difffilter = DiffFilter(maxsize=1024)
+    eq_(SMALL + placeholder(LARGE.splitlines(True)[0], 'data/large.txt'),
+        filtered(difffilter, SMALL + LARGE))
+    eq_([('data/large.txt', 'larger than 1024 bytes')], difffilter.omitted)
+
+
+def test_omit():
+    difffilter = DiffFilter()
+    eq_(SMALL + placeholder(LARGE.splitlines(True)[0], 'data/large.txt'),
+        filtered(difffilter, SMALL + LARGE, omit=['data/large.txt']))
+
+
+def test_spooled_sections():
+    # a file's part of the diff may be spooled to disk while it is checked
+    difffilter = DiffFilter(maxsize=1024 * 1024, spool_size=100)
+    eq_(SMALL + LARGE, filtered(difffilter, SMALL + LARGE, chunk_size=4096))
+
+
+class TestCreateReviewsData:
+
+    def setup(self):
+        self.ui = mock_ui()
+        self.ui.setconfig('reviewboard', 'diff_cache', 'false')
+        self.ui.setconfig('reviewboard', 'diff_workers', '1')
+        self.repo = get_repo(self.ui, 'two_revs')
+
+    def diffs(self):
+        diff, parentdiff = create_reviews_data(
+            self.ui, self.repo,
+            [(self.repo[1], self.repo[0], self.repo[0])])[0]
+        return diff.getvalue()
+
+    def test_not_configured(self):
+        assert 'Binary file' not in self.diffs()
+
+    def test_excluded(self):
+        self.ui.setconfig('reviewboard', 'diff_exclude', '*')
+        diff = self.diffs()
+        assert 'Binary file' in diff
+        assert '@@' not in diff
@@ -0,0 +1,101 @@
+from mock import patch
+from nose.tools import eq_
+
+from mercurial_reviewboard import getdiff, getdiffs
+from mercurial_reviewboard.diffpool import DiffPool, estimate, split
+from mercurial_reviewboard.tests import get_repo, mock_ui
+
+
+def all_pairs(repo):
+    return [(repo[r], repo[p]) for r in repo for p in repo if p < r]
+
+
+def test_pool_matches_getdiff():
+    ui = mock_ui()
+    repo = get_repo(ui, 'merge')
+    pairs = all_pairs(repo)
+    diffs = DiffPool(3, min_size=0).diffs(
+        repo, [(p.node(), r.node()) for r, p in pairs], spool_size=100)
+    eq_([getdiff(ui, repo, r, p).getvalue() for r, p in pairs],
+        [diff.getvalue() for diff in diffs])
+
+
+@patch('mercurial_reviewboard.diffpool.DiffPool')
+def test_single_worker(mock_pool):
+    ui = mock_ui()
+    ui.setconfig('reviewboard', 'diff_workers', '1')
+    repo = get_repo(ui, 'merge')
+    eq_(len(all_pairs(repo)), len(getdiffs(ui, repo, all_pairs(repo))))
+    assert not mock_pool.called
+
+
+@patch('mercurial_reviewboard.diffpool._multiprocessing')
+def test_single_chunk(mock_multiprocessing):
+    ui = mock_ui()
+    ui.setconfig('reviewboard', 'diff_workers', '4')
+    repo = get_repo(ui, 'two_revs')
+    eq_(getdiff(ui, repo, repo[1], repo[0]).getvalue(),
+        getdiffs(ui, repo, [(repo[1], repo[0])])[0].getvalue())
+    assert not mock_multiprocessing.return_value.Pool.called
+
+
+@patch('mercurial_reviewboard.diffpool._multiprocessing')
+def test_small_diffs_in_process(mock_multiprocessing):
+    ui = mock_ui()
+    repo = get_repo(ui, 'merge')
+    pairs = all_pairs(repo)
+    # every file in a job of its own, but only a few bytes in all
+    diffs = DiffPool(4, chunk_files=1).diffs(
+        repo, [(p.node(), r.node()) for r, p in pairs])
+    eq_([getdiff(ui, repo, r, p).getvalue() for r, p in pairs],
+        [diff.getvalue() for diff in diffs])
+    assert not mock_multiprocessing.return_value.Pool.called
+
+
+def test_estimate():
+    ui = mock_ui()
+    repo = get_repo(ui, 'two_revs')
+    changes = repo.status(repo[0].node(), repo[1].node())[:3]
+    size = estimate(repo, repo[0].node(), repo[1].node(), changes)
+    assert size > 0
+    eq_(size, sum([repo[1][f].size() for f in changes[0] + changes[1]] +
+                  [repo[0][f].size() for f in changes[0] + changes[2]]))
+
+
+@patch('mercurial_reviewboard.diffpool.cpu_count')
+@patch('mercurial_reviewboard.diffpool._multiprocessing')
+def test_default_small_diffs(mock_multiprocessing, mock_cpu_count):
+    ui = mock_ui()
+    repo = get_repo(ui, 'merge')
+    pairs = all_pairs(repo)
+    eq_([getdiff(ui, repo, r, p).getvalue() for r, p in pairs],
+        [diff.getvalue() for diff in getdiffs(ui, repo, pairs)])
+    assert not mock_multiprocessing.called
+    assert not mock_cpu_count.called
+
+
+def test_split():
+    changes = (['b', 'd', 'f'], ['a', 'e'], ['c'])
+    eq_([(['b'], ['a'], ['c']), (['d', 'f'], ['e'], [])],
+        split(changes, 3))
+
+
+def test_file_chunks_match_getdiff():
+    ui = mock_ui()
+    repo = get_repo(ui, 'merge')
+    pairs = all_pairs(repo)
+    # one file per job puts every file of a diff in a different process
+    pool = DiffPool(2, chunk_files=1, min_size=0)
+    diffs = pool.diffs(repo, [(p.node(), r.node()) for r, p in pairs])
+    eq_([getdiff(ui, repo, r, p).getvalue() for r, p in pairs],
+        [diff.getvalue() for diff in diffs])
+
+
+def test_several_workers():
+    ui = mock_ui()
+    ui.setconfig('reviewboard', 'diff_workers', '2')
+    ui.setconfig('reviewboard', 'diff_pool_min_size', '0')
+    repo = get_repo(ui, 'merge')
+    pairs = all_pairs(repo)
+    eq_([getdiff(ui, repo, r, p).getvalue() for r, p in pairs],
+        [diff.getvalue() for diff in getdiffs(ui, repo, pairs)])
@@ -0,0 +1,161 @@
+from mock import Mock, patch
+from nose.tools import eq_, raises, with_setup
+
+from mercurial import util
+from mercurial_reviewboard import postreview
+from mercurial_reviewboard.reviewboard import ReviewBoardError
+from mercurial_reviewboard.tests import (forget_posts, get_initial_opts,
+                                         get_repo, mock_ui)
+
+
+def read_diff(name):
+    return open('mercurial_reviewboard/tests/diffs/%s' % name, 'r').read()
+
+
+def make_reviewboard():
+    # Mock creates its methods on first use without a lock, the posting
+    # threads would each get one of their own
+    reviewboard = Mock()
+    reviewboard.new_request
+    reviewboard.update_request
+    return reviewboard
+
+
+def diffs_by_summary(mock_method):
+    diffs = {}
+    for args, kwargs in mock_method.call_args_list:
+        fields, diff = args[1], args[2]
+        diffs[fields['summary']] = diff.getvalue()
+    return diffs
+
+
+@patch('mercurial_reviewboard.getreviewboard')
+def test_each_new(mock_getreviewboard):
+    mock_reviewboard = make_reviewboard()
+    mock_reviewboard.new_request.side_effect = \
+        lambda repo_id, fields, diff, parentdiff, publish: \
+            fields['summary'] + '00'
+    mock_getreviewboard.return_value = mock_reviewboard
+
+    ui = mock_ui()
+    repo = get_repo(ui, 'two_revs')
+    opts = get_initial_opts()
+    opts['each'] = '0:1'
+    opts['repoid'] = '1'
+    postreview(ui, repo, **opts)
+
+    eq_(2, mock_reviewboard.new_request.call_count)
+    diffs = diffs_by_summary(mock_reviewboard.new_request)
+    eq_(read_diff('two_revs_0'), diffs['0'])
+    eq_(read_diff('two_revs_1'), diffs['1'])
+    assert not any(kwargs['publish'] for args, kwargs
+                   in mock_reviewboard.new_request.call_args_list)
+
+
+@with_setup(forget_posts, forget_posts)
+@patch('mercurial_reviewboard.getreviewboard')
+def test_each_existing(mock_getreviewboard):
+    mock_reviewboard = make_reviewboard()
+    mock_getreviewboard.return_value = mock_reviewboard
+
+    ui = mock_ui()
+    repo = get_repo(ui, 'two_revs')
+    opts = get_initial_opts()
+    opts['each'] = '0:1'
+    opts['existing'] = '10, 11'
+    opts['publish'] = True
+    postreview(ui, repo, **opts)
+
+    updated = sorted([args[0] for args, kwargs
+                      in mock_reviewboard.update_request.call_args_list])
+    eq_(['10', '11'], updated)
+    published = sorted([args[0] for args, kwargs
+                        in mock_reviewboard.update_request.call_args_list
+                        if kwargs['publish']])
+    eq_(['10', '11'], published)
+
+
+@raises(util.Abort)
+def test_each_wrong_number_of_existing():
+    ui = mock_ui()
+    repo = get_repo(ui, 'two_revs')
+    opts = get_initial_opts()
+    opts['each'] = '0:1'
+    opts['existing'] = '10'
+    postreview(ui, repo, **opts)
+
+
+@raises(util.Abort)
+def test_each_with_parent():
+    opts = get_initial_opts()
+    opts['each'] = '0:1'
+    opts['parent'] = '0'
+    postreview(mock_ui(), None, **opts)
+
+
+@with_setup(forget_posts, forget_posts)
+@patch('mercurial_reviewboard.getreviewboard')
+def test_each_failure_does_not_stop_others(mock_getreviewboard):
+    def update_request(id, fields, diff, parentdiff, publish):
+        if id == '10':
+            raise ReviewBoardError('no such request')
+    mock_reviewboard = make_reviewboard()
+    mock_reviewboard.update_request.side_effect = update_request
+    mock_getreviewboard.return_value = mock_reviewboard
+
+    ui = mock_ui()
+    repo = get_repo(ui, 'two_revs')
+    opts = get_initial_opts()
+    opts['each'] = '0:1'
+    opts['existing'] = '10,11'
+    try:
+        postreview(ui, repo, **opts)
+        assert 0, "Should have raised an Abort."
+    except util.Abort, e:
+        eq_('1 of 2 review requests could not be posted', str(e))
+    eq_(2, mock_reviewboard.update_request.call_count)
+
+
+@with_setup(forget_posts, forget_posts)
+@patch('mercurial_reviewboard.getreviewboard')
+def test_each_other_errors_reported(mock_getreviewboard):
+    def update_request(id, fields, diff, parentdiff, publish):
+        if id == '10':
+            raise util.Abort('interrupted')
+        if id == '11':
+            raise IOError(28, 'No space left on device')
+    mock_reviewboard = make_reviewboard()
+    mock_reviewboard.update_request.side_effect = update_request
+    mock_getreviewboard.return_value = mock_reviewboard
+
+    ui = mock_ui()
+    repo = get_repo(ui, 'two_revs')
+    opts = get_initial_opts()
+    opts['each'] = '0:1'
+    opts['existing'] = '10,11'
+    try:
+        postreview(ui, repo, **opts)
+        assert 0, "Should have raised an Abort."
+    except util.Abort, e:
+        eq_('2 of 2 review requests could not be posted', str(e))
+    output = ''.join([args[0] for args, kwargs in ui.status.call_args_list])
+    assert 'error: interrupted' in output, output
+    assert 'No space left on device' in output, output
+
+
+@with_setup(forget_posts, forget_posts)
+@patch('mercurial_reviewboard.getreviewboard')
+def test_each_repost_skips_unchanged(mock_getreviewboard):
+    mock_reviewboard = make_reviewboard()
+    mock_getreviewboard.return_value = mock_reviewboard
+
+    ui = mock_ui()
+    repo = get_repo(ui, 'two_revs')
+    opts = get_initial_opts()
+    opts['each'] = '0:1'
+    opts['existing'] = '10,11'
+    postreview(ui, repo, **opts)
+    eq_(2, mock_reviewboard.update_request.call_count)
+
+    postreview(ui, repo, **opts)
+    eq_(2, mock_reviewboard.update_request.call_count)
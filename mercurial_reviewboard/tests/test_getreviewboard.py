@@ -4,8 +4,9 @@ from mercurial_reviewboard import getreviewboard
 from mercurial_reviewboard.tests import get_initial_opts, mock_ui
 
 
+@patch('mercurial_reviewboard.getcache')
 @patch('mercurial_reviewboard.make_rbclient')
-def test_get_credentials_from_config(mock_reviewboard):
+def test_get_credentials_from_config(mock_reviewboard, mock_getcache):
         
     # username and password configs are included 
     # in the mock
@@ -15,6 +16,17 @@ def test_get_credentials_from_config(mock_reviewboard):
     getreviewboard(ui, opts)
     
     mock_reviewboard.assert_called_with('http://example.com', 
-        'foo', 'bar', proxy=None, apiver='')
+        'foo', 'bar', proxy=None, apiver='',
+        cache=mock_getcache.return_value, compress_uploads=False, ui=ui)
 
-    
\ No newline at end of file
+
+@patch('mercurial_reviewboard.getcache')
+@patch('mercurial_reviewboard.make_rbclient')
+def test_refresh_repos(mock_reviewboard, mock_getcache):
+    ui = mock_ui()
+    opts = get_initial_opts()
+    opts['refresh_repos'] = True
+
+    getreviewboard(ui, opts)
+
+    mock_getcache.return_value.invalidate.assert_called_with('repositories')
@@ -12,4 +12,4 @@ def test_outgoing(mock_send):
     postreview(ui, repo, **opts)
     
     expected = open('mercurial_reviewboard/tests/diffs/two_revs_1', 'r').read()
-    eq_(expected, mock_send.call_args[0][4])
\ No newline at end of file
+    eq_(expected, mock_send.call_args[0][4].getvalue())
\ No newline at end of file
@@ -16,7 +16,7 @@ def test_outgoing(mock_send):
     postreview(ui, repo, **opts)
     
     expected = open('mercurial_reviewboard/tests/diffs/outgoing', 'r').read()
-    eq_(expected, mock_send.call_args[0][4])
+    eq_(expected, mock_send.call_args[0][4].getvalue())
 
 
 @patch('mercurial_reviewboard.send_review')
@@ -30,7 +30,7 @@ def test_outgoing_one_rev(mock_send):
     
     expected = open('mercurial_reviewboard/tests/diffs/outgoing_one_rev', 
         'r').read()
-    eq_(expected, mock_send.call_args[0][4])
+    eq_(expected, mock_send.call_args[0][4].getvalue())
 
 
 @patch('mercurial_reviewboard.send_review')
@@ -44,10 +44,11 @@ def test_outgoing_one_rev_no_outgoing_flag(mock_send):
     
         expected = open('mercurial_reviewboard/tests/diffs/outgoing_one_rev', 
             'r').read()
-        eq_(expected, mock_send.call_args[0][4])
+        eq_(expected, mock_send.call_args[0][4].getvalue())
     except util.Abort, e:
         expected = ("When using the -g/--outgoingchanges flag, you must "
-            "also use either the -o or the -O <repo> flag.")
+            "also use either the -o, the -O <repo> or the "
+            "--rparent-from-phases flag.")
         eq_(expected, e.__str__())
 
 
@@ -64,7 +65,7 @@ def test_outgoing_with_branch(mock_send):
     
     expected = open('mercurial_reviewboard/tests/diffs/outgoing_with_branch', 
                     'r').read()
-    eq_(expected, mock_send.call_args[0][4])
+    eq_(expected, mock_send.call_args[0][4].getvalue())
 
 
 @patch('mercurial_reviewboard.send_review')
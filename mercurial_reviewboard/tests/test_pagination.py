@@ -0,0 +1,138 @@
+import shutil
+import tempfile
+
+from mock import Mock
+from nose.tools import eq_
+
+from mercurial_reviewboard.reviewboard import (Api20Client, HttpClient,
+                                               ResourceCache)
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+
+def make_repositories(count):
+    return [{'id': i, 'name': 'repo%d' % i, 'tool': 'Mercurial',
+             'path': 'http://hg.example.org/repo%d' % i}
+            for i in range(1, count + 1)]
+
+
+class TestPagination:
+
+    def setup(self):
+        # 450 repositories are three pages of 200
+        self.server = StubServer(repositories=make_repositories(450)).start()
+        self.cachedir = tempfile.mkdtemp()
+
+    def teardown(self):
+        self.server.stop()
+        shutil.rmtree(self.cachedir)
+
+    def make_client(self, cache=False, ttl=3600):
+        httpclient = HttpClient(self.server.url)
+        httpclient.cookie_file = '/dev/null'
+        if cache:
+            cache = ResourceCache(self.cachedir, self.server.url, ttl)
+        else:
+            cache = None
+        return Api20Client(httpclient, cache)
+
+    def listing_requests(self):
+        return [r for r in self.server.requests
+                if r[1] == '/api/repositories/']
+
+    def test_all_pages(self):
+        client = self.make_client()
+        ids = [r.id for r in client.repositories()]
+        eq_(range(1, 451), ids)
+        eq_(3, len(self.listing_requests()))
+
+        # iterating again uses the pages already fetched
+        eq_(450, len(list(client.repositories())))
+        eq_(3, len(self.listing_requests()))
+
+    def test_lazy(self):
+        client = self.make_client()
+        for r in client.repositories():
+            if r.id == 5:
+                break
+        eq_(1, len(self.listing_requests()))
+
+    def test_prefetch(self):
+        client = self.make_client()
+        client.prefetch = True
+        eq_(450, len(list(client.repositories())))
+        eq_(3, len(self.listing_requests()))
+
+    def test_listing_cached_once_complete(self):
+        client = self.make_client(cache=True)
+        for r in client.repositories():
+            if r.id == 5:
+                break
+
+        # part of the list is not stored
+        client = self.make_client(cache=True)
+        for r in client.repositories():
+            if r.id == 5:
+                break
+        eq_(2, len(self.listing_requests()))
+
+        client = self.make_client(cache=True)
+        client._cache.set = Mock(wraps=client._cache.set)
+        eq_(450, len(list(client.repositories())))
+        eq_(5, len(self.listing_requests()))
+        eq_(1, client._cache.set.call_count)
+
+        # the whole list is served from the cache
+        client = self.make_client(cache=True)
+        eq_(450, len(list(client.repositories())))
+        eq_(range(1, 451), [r.id for r in client.repositories()])
+        eq_(5, len(self.listing_requests()))
+
+    def test_pending_user_requests(self):
+        for i in range(250):
+            self.server.new_review_request(1)
+        client = self.make_client()
+        eq_(250, len(list(client.pending_user_requests())))
+
+    def test_find_repository(self):
+        client = self.make_client()
+        eq_(5, client.find_repository('http://hg.example.org/repo5/').id)
+        eq_(1, len(self.listing_requests()))
+
+        # a repository on the last page fetches the pages before it
+        eq_(420, client.find_repository('ssh://hg.example.org/repo420').id)
+        eq_(3, len(self.listing_requests()))
+        eq_(None, client.find_repository('http://hg.example.org/nothere'))
+        eq_(3, len(self.listing_requests()))
+
+    def test_find_repository_cached_index(self):
+        client = self.make_client(cache=True)
+        eq_(420, client.find_repository('http://hg.example.org/repo420').id)
+        eq_(3, len(self.listing_requests()))
+
+        # the stored index answers without a request while it is fresh
+        client = self.make_client(cache=True)
+        eq_(420, client.find_repository('http://hg.example.org/repo420').id)
+        eq_(7, client.find_repository('http://hg.example.org/repo7').id)
+        eq_(3, len(self.listing_requests()))
+
+    def test_find_repository_warm_runs(self):
+        # a repository on the first page still caches the whole list
+        client = self.make_client(cache=True)
+        eq_(5, client.find_repository('http://hg.example.org/repo5').id)
+        eq_(3, len(self.listing_requests()))
+
+        for i in range(3):
+            client = self.make_client(cache=True)
+            eq_(5, client.find_repository('http://hg.example.org/repo5').id)
+        eq_(3, len(self.listing_requests()))
+
+    def test_stale_list_fetched_in_full(self):
+        client = self.make_client(cache=True)
+        eq_(450, len(list(client.repositories())))
+        eq_(3, len(self.listing_requests()))
+
+        # the first page is unchanged, the change is on the last one
+        self.server.repositories[419]['path'] = 'http://hg.example.org/moved'
+        client = self.make_client(cache=True, ttl=0)
+        eq_(420, client.find_repository('http://hg.example.org/moved').id)
+        eq_(6, len(self.listing_requests()))
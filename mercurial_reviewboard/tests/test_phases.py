@@ -0,0 +1,87 @@
+import shutil
+import tempfile
+
+from mock import patch
+from nose.tools import eq_
+
+from mercurial import commands, hg
+
+from mercurial_reviewboard import find_rparent, postreview
+from mercurial_reviewboard.tests import get_initial_opts, mock_ui, repos_dir
+
+
+class PhaseRepo:
+    '''a clone of a test repository with some changesets made drafts'''
+
+    source = None
+    drafts = []
+
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.ui = mock_ui()
+        path = '%s/repo' % self.dir
+        hg.clone(self.ui, {}, '%s/%s' % (repos_dir, self.source), path,
+                 update=False)
+        self.repo = hg.repository(self.ui, path)
+        if self.drafts:
+            commands.phase(self.ui, self.repo, *self.drafts,
+                           **{'public': False, 'draft': True, 'secret': False,
+                              'force': True, 'rev': []})
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    def opts(self, **extra):
+        opts = get_initial_opts()
+        opts['outgoing'] = True
+        opts['rparent_from_phases'] = True
+        opts.update(extra)
+        return opts
+
+
+class TestSingleRoot(PhaseRepo):
+
+    source = 'two_revs_clone'
+    drafts = ['2']
+
+    @patch('mercurial_reviewboard.remoteparent')
+    def test_rparent_from_phases(self, mock_remoteparent):
+        rparent = find_rparent(self.ui, self.repo, self.repo[2], self.opts())
+        eq_(1, rparent.rev())
+        assert not mock_remoteparent.called
+
+    @patch('mercurial_reviewboard.remoteparent')
+    def test_config_default(self, mock_remoteparent):
+        self.ui.setconfig('reviewboard', 'rparent_from_phases', 'true')
+        opts = self.opts(rparent_from_phases=False)
+        rparent = find_rparent(self.ui, self.repo, self.repo[2], opts)
+        eq_(1, rparent.rev())
+        assert not mock_remoteparent.called
+
+    @patch('mercurial_reviewboard.remoteparent')
+    def test_public_falls_back(self, mock_remoteparent):
+        rparent = find_rparent(self.ui, self.repo, self.repo[3], self.opts())
+        eq_(mock_remoteparent.return_value, rparent)
+
+    @patch('mercurial_reviewboard.remoteparent')
+    def test_not_asked_for(self, mock_remoteparent):
+        opts = self.opts(rparent_from_phases=False)
+        rparent = find_rparent(self.ui, self.repo, self.repo[2], opts)
+        eq_(mock_remoteparent.return_value, rparent)
+
+    @patch('mercurial_reviewboard.send_review')
+    def test_outgoingchanges_without_upstream(self, mock_send):
+        opts = self.opts(outgoing=False, outgoingchanges=True)
+        postreview(self.ui, self.repo, '2', **opts)
+        eq_(1, mock_send.call_args[0][3].rev())
+
+
+class TestSeveralRoots(PhaseRepo):
+
+    source = 'merge'
+    drafts = ['1:5']
+
+    @patch('mercurial_reviewboard.remoteparent')
+    def test_ambiguous_falls_back(self, mock_remoteparent):
+        rparent = find_rparent(self.ui, self.repo, self.repo[5], self.opts())
+        eq_(mock_remoteparent.return_value, rparent)
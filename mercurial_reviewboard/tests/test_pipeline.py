@@ -0,0 +1,77 @@
+from mock import Mock
+from nose.tools import eq_
+
+from mercurial_reviewboard.errors import ReviewBoardError
+from mercurial_reviewboard.reviewboard import (Api20Client, ConnectionPool,
+                                               HttpClient)
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+
+class TestPipeline:
+
+    def setup(self):
+        self.server = StubServer(latency=0.05).start()
+        httpclient = HttpClient(self.server.url, pool=ConnectionPool())
+        httpclient.cookie_file = '/dev/null'
+        self.client = Api20Client(httpclient)
+
+    def teardown(self):
+        self.server.stop()
+
+    def calls(self):
+        return [(method, path) for method, path, size in self.server.requests]
+
+    def test_draft_after_diff(self):
+        self.client.new_request('1', {'summary': 'x'}, 'diff')
+        eq_([('POST', '/api/review-requests/'),
+             ('POST', '/api/review-requests/1/diffs/'),
+             ('PUT', '/api/review-requests/1/draft/')], self.calls())
+        eq_(1, self.server.max_active)
+        assert not self.server.review_requests[1]['public']
+
+    def test_draft_and_diff_overlap(self):
+        self.client.overlap_draft = True
+        self.client.new_request('1', {'summary': 'x'}, 'diff')
+        eq_(2, self.server.max_active)
+        eq_(['POST', 'POST', 'PUT'],
+            sorted([method for method, path in self.calls()]))
+        assert not self.server.review_requests[1]['public']
+
+    def test_failed_upload_not_masked(self):
+        self.client.overlap_draft = True
+        self.client._set_fields = Mock(side_effect=ReviewBoardError('draft'))
+        self.client._upload_diff = Mock(side_effect=ReviewBoardError('diff'))
+        req = {'id': 1}
+        try:
+            self.client._set_request_details(req, {'summary': 'x'}, 'diff',
+                                             '')
+        except ReviewBoardError, e:
+            eq_('diff', e.msg)
+        else:
+            assert False, 'no error raised'
+        eq_([((req, {'summary': 'x'}), {})],
+            self.client._set_fields.call_args_list)
+
+    def test_publish_folded_into_draft(self):
+        self.client.new_request('1', {'summary': 'x'}, 'diff', publish=True)
+        eq_([('POST', '/api/review-requests/'),
+             ('POST', '/api/review-requests/1/diffs/'),
+             ('PUT', '/api/review-requests/1/draft/')], self.calls())
+        eq_(1, self.server.max_active)
+        assert self.server.review_requests[1]['public']
+
+    def test_publish_without_changes(self):
+        id = self.client.new_request('1')
+        self.client.update_request(id, publish=True)
+        eq_([('POST', '/api/review-requests/'),
+             ('PUT', '/api/review-requests/1/draft/')], self.calls())
+        assert self.server.review_requests[1]['public']
+
+    def test_without_pipeline(self):
+        self.client.pipeline = False
+        self.client.new_request('1', {'summary': 'x'}, 'diff', publish=True)
+        eq_([('POST', '/api/review-requests/'),
+             ('PUT', '/api/review-requests/1/draft/'),
+             ('POST', '/api/review-requests/1/diffs/'),
+             ('PUT', '/api/review-requests/1/draft/')], self.calls())
+        assert self.server.review_requests[1]['public']
@@ -17,7 +17,7 @@ def test_diff(mock_send):
     
     expected = open('mercurial_reviewboard/tests/diffs/two_revs_1', 
         'r').read()
-    eq_(expected, mock_send.call_args[0][4])
+    eq_(expected, mock_send.call_args[0][4].getvalue())
 
 
 @patch('mercurial_reviewboard.send_review')
@@ -32,4 +32,4 @@ def test_parentdiff(mock_send):
     
     expected = open('mercurial_reviewboard/tests/diffs/two_revs_0', 
         'r').read()
-    eq_(expected, mock_send.call_args[0][5])
\ No newline at end of file
+    eq_(expected, mock_send.call_args[0][5].getvalue())
\ No newline at end of file
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+
+from mock import Mock, patch
+from nose.tools import eq_, with_setup
+
+from mercurial_reviewboard import send_review
+from mercurial_reviewboard.diffbuffer import spooldiff
+from mercurial_reviewboard.poststate import PostState, digest, post_digests
+from mercurial_reviewboard.tests import (forget_posts, get_initial_opts,
+                                         get_repo, mock_ui)
+
+
+def test_digest_of_diffbuffer():
+    data = 'x' * 100000
+    eq_(digest(data), digest(spooldiff([data[:30000], data[30000:]])))
+
+
+class TestPostState:
+
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'reviewboard', 'posts.json')
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    def test_record(self):
+        state = PostState(self.path, 'http://example.com/')
+        eq_({}, state.get('1'))
+        digests = post_digests({'summary': 's'}, 'diff', '')
+        state.record(1, digests)
+
+        eq_(digests, PostState(self.path, 'http://example.com').get('1'))
+        eq_({}, PostState(self.path, 'http://other.example.com').get('1'))
+
+        state.forget('1')
+        eq_({}, state.get('1'))
+
+    def test_unreadable_state(self):
+        os.makedirs(os.path.dirname(self.path))
+        open(self.path, 'w').write('{not json')
+        state = PostState(self.path, 'http://example.com')
+        eq_({}, state.get('1'))
+        state.record('1', {'diff': 'abc'})
+        eq_({'diff': 'abc'}, state.get('1'))
+
+
+def post(**extra):
+    ui = mock_ui()
+    repo = get_repo(ui, 'two_revs')
+    opts = get_initial_opts()
+    opts['existing'] = '12'
+    opts.update(extra)
+    c, parent = repo['1'], repo['0']
+    diff = spooldiff(['diff --git a/1 b/1\n'])
+    send_review(ui, repo, c, parent, diff, '', opts)
+    return ui
+
+
+@with_setup(forget_posts, forget_posts)
+@patch('mercurial_reviewboard.getreviewboard')
+def test_repost_unchanged_skips_upload(mock_getreviewboard):
+    reviewboard = Mock()
+    mock_getreviewboard.return_value = reviewboard
+    post()
+    eq_(1, reviewboard.update_request.call_count)
+
+    ui = post()
+    eq_(1, reviewboard.update_request.call_count)
+    assert 'nothing posted' in ui.status.call_args[0][0]
+
+
+@with_setup(forget_posts, forget_posts)
+@patch('mercurial_reviewboard.getreviewboard')
+def test_repost_unchanged_updates_changed_fields(mock_getreviewboard):
+    reviewboard = Mock()
+    mock_getreviewboard.return_value = reviewboard
+    post(update=True)
+    post(update=True, summary='new summary')
+    eq_(2, reviewboard.update_request.call_count)
+    args = reviewboard.update_request.call_args[0]
+    eq_('new summary', args[1]['summary'])
+    eq_('', args[2])
+
+
+@with_setup(forget_posts, forget_posts)
+@patch('mercurial_reviewboard.getreviewboard')
+def test_repost_unchanged_still_publishes(mock_getreviewboard):
+    reviewboard = Mock()
+    mock_getreviewboard.return_value = reviewboard
+    post()
+    post(publish=True)
+    eq_(['12'], [args[0] for args, kwargs
+                 in reviewboard.update_request.call_args_list
+                 if kwargs['publish']])
+
+
+@with_setup(forget_posts, forget_posts)
+@patch('mercurial_reviewboard.getreviewboard')
+def test_force_upload(mock_getreviewboard):
+    reviewboard = Mock()
+    mock_getreviewboard.return_value = reviewboard
+    post()
+    post(force_upload=True)
+    eq_(2, reviewboard.update_request.call_count)
+    assert reviewboard.update_request.call_args[0][2]
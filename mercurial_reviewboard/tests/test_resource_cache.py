@@ -0,0 +1,75 @@
+import shutil
+import tempfile
+import time
+
+from nose.tools import eq_
+
+from mercurial_reviewboard.reviewboard import (Api20Client, HttpClient,
+                                               ResourceCache)
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+
+class TestRepositoryCache:
+
+    def setup(self):
+        self.server = StubServer().start()
+        self.cachedir = tempfile.mkdtemp()
+
+    def teardown(self):
+        self.server.stop()
+        shutil.rmtree(self.cachedir)
+
+    def make_client(self, ttl=60):
+        httpclient = HttpClient(self.server.url)
+        httpclient.cookie_file = '/dev/null'
+        cache = ResourceCache(self.cachedir, self.server.url, ttl)
+        return Api20Client(httpclient, cache), cache
+
+    def listing_requests(self):
+        return [r for r in self.server.requests
+                if r[1] == '/api/repositories/']
+
+    def test_warm_cache_makes_no_requests(self):
+        client, cache = self.make_client()
+        eq_('repo', list(client.repositories())[0].name)
+        eq_(1, len(self.listing_requests()))
+
+        client, cache = self.make_client()
+        eq_('repo', list(client.repositories())[0].name)
+        eq_(1, len(self.listing_requests()))
+
+    def test_stale_cache_is_revalidated(self):
+        client, cache = self.make_client(ttl=0)
+        list(client.repositories())
+        fetched = cache.get('repositories')['time']
+
+        time.sleep(0.01)
+        client, cache = self.make_client(ttl=0)
+        eq_('repo', list(client.repositories())[0].name)
+        eq_(2, len(self.listing_requests()))
+        # the server answered 304, the cached list was used again
+        assert cache.get('repositories')['time'] > fetched
+
+    def test_changed_listing_is_fetched(self):
+        client, cache = self.make_client(ttl=0)
+        list(client.repositories())
+
+        self.server.repositories = [{'id': 2, 'name': 'other',
+                                     'tool': 'Mercurial', 'path': 'x'}]
+        client, cache = self.make_client(ttl=0)
+        eq_('other', list(client.repositories())[0].name)
+
+    def test_invalidate(self):
+        client, cache = self.make_client()
+        list(client.repositories())
+
+        client, cache = self.make_client()
+        cache.invalidate('repositories')
+        list(client.repositories())
+        eq_(2, len(self.listing_requests()))
+
+
+def test_unwritable_cache_dir():
+    cache = ResourceCache('/dev/null/nonexistent', 'http://example.org')
+    cache.set('repositories', {'stat': 'ok'})
+    eq_({'stat': 'ok'}, cache.get('repositories')['data'])
@@ -0,0 +1,76 @@
+from mock import Mock
+from nose.tools import eq_
+
+from mercurial.node import nullrev
+
+from mercurial_reviewboard import find_branch_parent
+from mercurial_reviewboard.revgraph import RevGraph, revgraph
+from mercurial_reviewboard.tests import get_repo, mock_ui
+
+
+def nodesbetween(repo, base, head):
+    nodes = repo.changelog.nodesbetween([repo[base].node()],
+                                        [repo[head].node()])[0]
+    return [repo[n].rev() for n in nodes if repo[n].rev() != nullrev]
+
+
+def test_between_matches_nodesbetween():
+    for name in ('two_revs', 'merge', 'branch'):
+        repo = get_repo(mock_ui(), name)
+        graph = revgraph(repo)
+        for head in repo:
+            for base in [nullrev] + list(repo):
+                eq_(nodesbetween(repo, base, head), graph.between(base, head))
+
+
+def test_ancestors():
+    repo = get_repo(mock_ui(), 'merge')
+    graph = revgraph(repo)
+    for rev in repo:
+        expected = set([rev]) | set(repo.changelog.ancestors([rev]))
+        eq_(expected, graph.ancestors(rev))
+    eq_(set(), graph.ancestors(nullrev))
+
+
+def test_walk_stops_at_base():
+    repo = get_repo(mock_ui(), 'merge')
+    graph = RevGraph(repo)
+    walked = []
+    parentrevs = repo.changelog.parentrevs
+    def record(rev):
+        walked.append(rev)
+        return parentrevs(rev)
+    graph._changelog = Mock(wraps=repo.changelog)
+    graph._changelog.parentrevs = record
+    eq_([2, 5], graph.between(2, 5))
+    eq_([], [rev for rev in walked if rev < 2])
+
+    del walked[:]
+    eq_(1, graph.remoteparent(5, [2, 4]))
+    eq_([], [rev for rev in walked if rev < 2])
+
+
+def test_remoteparent():
+    repo = get_repo(mock_ui(), 'two_revs')
+    graph = revgraph(repo)
+    eq_(nullrev, graph.remoteparent(1, [0, 1]))
+    eq_(0, graph.remoteparent(1, [1]))
+    eq_(None, graph.remoteparent(0, [1]))
+
+
+def test_branch_parent():
+    ui = mock_ui()
+    repo = get_repo(ui, 'branch')
+    for rev in repo:
+        ctx = repo[rev]
+        # walk the first parents like find_branch_parent used to
+        expected = ctx
+        while expected.rev() != nullrev and \
+                expected.branch() == ctx.branch():
+            expected = expected.parents()[0]
+        eq_(expected.rev(), find_branch_parent(ui, ctx).rev())
+
+
+def test_shared_per_command():
+    repo = get_repo(mock_ui(), 'two_revs')
+    eq_(revgraph(repo), revgraph(repo))
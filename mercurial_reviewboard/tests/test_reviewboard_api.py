@@ -1,5 +1,8 @@
 # coding=UTF8
+from nose.tools import eq_
+
 from mercurial_reviewboard import reviewboard
+from mercurial_reviewboard.diffbuffer import spooldiff
 
 
 SAMPLE_DIFF='''diff -r 000000000000 -r 95a59137df3f file_with_special_char.txt
@@ -17,6 +20,37 @@ def test_utf8_files():
     content_type, content = client._encode_multipart_formdata({}, files)
     expected_substring = u'Look it up in the encyclop\xe6dia.'
 
-    unicode_content = content.decode('utf-8')
+    unicode_content = content.read().decode('utf-8')
+
+    assert unicode_content.index(expected_substring)
+
+
+def test_multipart_length():
+    diff = spooldiff([SAMPLE_DIFF] * 10, spool_size=100)
+    files = {'path': {'content': diff, 'filename': 'diff'}}
+    client = reviewboard.HttpClient('http://example.org')
+    content_type, content = client._encode_multipart_formdata(
+        {'public': '1'}, files)
+
+    data = content.read()
+    eq_(len(content), len(data))
+    assert content_type.endswith(content.boundary)
+    assert data.endswith('--' + content.boundary + '--\r\n\r\n')
+    eq_(10, data.count('encyclop\xc3\xa6dia'))
+
+
+def test_multipart_read_in_blocks():
+    diff = spooldiff([SAMPLE_DIFF] * 10, spool_size=100)
+    files = {'path': {'content': diff, 'filename': 'diff'}}
+    body = reviewboard.MultipartBody('BOUNDARY', {}, files)
+
+    blocks = []
+    while True:
+        block = body.read(64)
+        if not block:
+            break
+        assert len(block) <= 64
+        blocks.append(block)
 
-    assert unicode_content.index(expected_substring)
\ No newline at end of file
+    body.rewind()
+    eq_(body.read(), ''.join(blocks))
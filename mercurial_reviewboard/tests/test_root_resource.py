@@ -0,0 +1,74 @@
+import shutil
+import tempfile
+
+from mock import patch
+from nose.tools import eq_
+
+from mercurial_reviewboard.reviewboard import (Api20Client, HttpClient,
+    ResourceCache, expand_template, fetch_root, make_rbclient)
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+
+def test_expand_template():
+    eq_('http://example.com/api/review-requests/1%202/',
+        expand_template('http://example.com/api/review-requests/'
+                        '{review_request_id}/', review_request_id='1 2'))
+
+
+class TestRootResource:
+
+    def setup(self):
+        self.server = StubServer(accept_gzip=True).start()
+        self.cachedir = tempfile.mkdtemp()
+
+    def teardown(self):
+        self.server.stop()
+        shutil.rmtree(self.cachedir)
+
+    def make_httpclient(self):
+        httpclient = HttpClient(self.server.url)
+        httpclient.cookie_file = '/dev/null'
+        return httpclient
+
+    def make_cache(self, ttl=60):
+        return ResourceCache(self.cachedir, self.server.url, ttl)
+
+    def root_requests(self):
+        return [r for r in self.server.requests if r[1] == '/api/']
+
+    def test_cached(self):
+        root = fetch_root(self.make_httpclient(), self.make_cache())
+        assert 'uri_templates' in root
+        httpclient = self.make_httpclient()
+        eq_(root, fetch_root(httpclient, self.make_cache()))
+        eq_(1, len(self.root_requests()))
+        # known without asking the server again
+        eq_(True, httpclient.accepts_gzip)
+
+    def test_stale_revalidated(self):
+        root = fetch_root(self.make_httpclient(), self.make_cache(ttl=0))
+        httpclient = self.make_httpclient()
+        eq_(root, fetch_root(httpclient, self.make_cache(ttl=0)))
+        eq_(2, len(self.root_requests()))
+        eq_(True, httpclient.accepts_gzip)
+
+    def test_update_without_fetching_request(self):
+        root = fetch_root(self.make_httpclient())
+        client = Api20Client(self.make_httpclient(), root=root)
+        id = client.new_request('1')
+        client = Api20Client(self.make_httpclient(), root=root)
+        client.update_request(id, {'summary': 'x'}, publish=True)
+        eq_([('POST', '/api/review-requests/'),
+             ('PUT', '/api/review-requests/1/draft/')],
+            [(method, path) for method, path, size in self.server.requests
+             if path != '/api/'])
+        assert self.server.review_requests[1]['public']
+
+    @patch('mercurial_reviewboard.reviewboard.homepath')
+    def test_make_rbclient_detects_from_cache(self, mock_homepath):
+        mock_homepath.return_value = self.cachedir
+        for i in range(2):
+            client = make_rbclient(self.server.url, 'foo', 'bar',
+                                   cache=self.make_cache())
+            assert isinstance(client, Api20Client)
+        eq_(1, len(self.root_requests()))
@@ -0,0 +1,16 @@
+import subprocess
+import sys
+
+from nose.tools import eq_
+
+
+def test_loading_imports_no_client_code():
+    script = ('import sys, mercurial_reviewboard\n'
+              'print " ".join(sorted([m for m in sys.modules if m in %r]))'
+              % ['mercurial_reviewboard.' + name for name in
+                 ('reviewboard', 'asyncclient', 'poststate', 'diffpool',
+                  'diffcache', 'workers')])
+    child = subprocess.Popen([sys.executable, '-c', script],
+                             stdout=subprocess.PIPE)
+    eq_('', child.communicate()[0].strip())
+    eq_(0, child.returncode)
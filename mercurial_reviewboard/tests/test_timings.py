@@ -0,0 +1,125 @@
+import json
+import os
+import shutil
+import tempfile
+
+from mock import Mock, patch
+from nose.tools import eq_, with_setup
+
+from mercurial_reviewboard import postreview, timings
+from mercurial_reviewboard.reviewboard import HttpClient
+from mercurial_reviewboard.tests import (forget_posts, get_initial_opts,
+                                         get_repo, mock_ui)
+from mercurial_reviewboard.tests.stubserver import StubServer
+
+
+def test_disabled_spans_are_free():
+    timings.disable()
+    span = timings.start('anything', x=1)
+    span.finish()
+    assert span is timings._nullspan
+
+
+def test_nesting_and_report():
+    recorder = timings.enable()
+    try:
+        outer = timings.start('outer')
+        timings.start('inner', path='/api/').finish(status=200)
+        outer.finish()
+    finally:
+        timings.disable()
+    eq_([('outer', 0), ('inner', 1)],
+        [(span.name, span.depth) for span in recorder.finished()])
+    report = recorder.report()
+    assert report[1].endswith('  inner path=/api/ status=200\n'), report[1]
+    eq_('totals:\n', report[2])
+
+
+def test_write_json_lines():
+    recorder = timings.enable()
+    try:
+        timings.start('step', n=1).finish()
+    finally:
+        timings.disable()
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'timings.jsonl')
+        recorder.write(path, run='1')
+        recorder.write(path, run='2')
+        records = [json.loads(line) for line in open(path)]
+        eq_(['1', '2'], [r['run'] for r in records])
+        eq_(('step', 1), (records[0]['name'], records[0]['n']))
+        assert records[0]['duration'] >= 0
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_http_spans():
+    server = StubServer().start()
+    recorder = timings.enable()
+    try:
+        httpclient = HttpClient(server.url)
+        httpclient.cookie_file = '/dev/null'
+        httpclient.api_request('GET', '/api/')
+        httpclient.api_request('POST', '/api/review-requests/',
+                               {'repository': '1'})
+    finally:
+        timings.disable()
+        server.stop()
+    spans = [s for s in recorder.finished() if s.name == 'http']
+    eq_([('GET', '/api/', 200), ('POST', '/api/review-requests/', 201)],
+        [(s.attrs['method'], s.attrs['path'], s.attrs['status'])
+         for s in spans])
+    assert spans[1].attrs['sent'] > 0
+    assert spans[0].attrs['received'] > 0
+
+
+@with_setup(forget_posts, forget_posts)
+@patch('mercurial_reviewboard.getreviewboard')
+def test_timings_option(mock_getreviewboard):
+    mock_getreviewboard.return_value = Mock()
+    ui = mock_ui()
+    repo = get_repo(ui, 'two_revs')
+    opts = get_initial_opts()
+    opts['timings'] = True
+    opts['existing'] = '1'
+    postreview(ui, repo, **opts)
+    output = ''.join([args[0] for args, kwargs in ui.status.call_args_list])
+    assert '\ntimings:\n' in output
+    assert 'postreview' in output
+    assert 'createfields' in output
+    assert timings._recorder is None
+
+
+def test_memory_report():
+    recorder = timings.enable(memory=True)
+    try:
+        span = timings.start('diff')
+        data = 'x' * (8 * 1024 * 1024)
+        span.finish()
+        del data
+    finally:
+        timings.disable()
+    span = recorder.finished()[0]
+    assert span.peak >= span.peak_start
+    assert span.rss > 0
+    lines = recorder.memory_report([('diff', 'diff'), ('upload', 'http')])
+    eq_(3, len(lines))
+    assert lines[1].startswith('diff '), lines[1]
+    eq_(['upload', '-', '-', '-'], lines[2].split())
+
+
+@with_setup(forget_posts, forget_posts)
+@patch('mercurial_reviewboard.getreviewboard')
+def test_profile_memory_option(mock_getreviewboard):
+    mock_getreviewboard.return_value = Mock()
+    ui = mock_ui()
+    repo = get_repo(ui, 'two_revs')
+    opts = get_initial_opts()
+    opts['profile_memory'] = True
+    opts['existing'] = '1'
+    postreview(ui, repo, **opts)
+    output = ''.join([args[0] for args, kwargs in ui.status.call_args_list])
+    assert '\nmemory:\n' in output
+    assert 'fields' in output
+    assert timings._recorder is None
@@ -0,0 +1,52 @@
+import threading
+import time
+
+from nose.tools import eq_, raises
+
+from mercurial_reviewboard.workers import WorkerPool
+
+
+def test_results_in_order():
+    pool = WorkerPool(3)
+    jobs = pool.map(lambda x: x * 2, range(10))
+    eq_(range(0, 20, 2), [job.result() for job in jobs])
+    pool.shutdown()
+
+
+def test_bounded():
+    pool = WorkerPool(2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+    release = threading.Event()
+    def work():
+        lock.acquire()
+        running.append(1)
+        peak.append(len(running))
+        lock.release()
+        release.wait(1)
+        lock.acquire()
+        running.pop()
+        lock.release()
+    jobs = [pool.submit(work) for i in range(5)]
+    for i in range(100):
+        if len(running) == 2:
+            break
+        time.sleep(0.01)
+    release.set()
+    for job in jobs:
+        job.result()
+    pool.shutdown()
+    eq_(2, max(peak))
+
+
+@raises(ValueError)
+def test_exception_reraised():
+    pool = WorkerPool(1)
+    def fail():
+        raise ValueError('boom')
+    job = pool.submit(fail)
+    try:
+        job.result()
+    finally:
+        pool.shutdown()
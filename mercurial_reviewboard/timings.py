@@ -0,0 +1,206 @@
+# span timings of the steps of a postreview run
+
+import os
+import threading
+import time
+
+from memory import peak_rss, rss
+
+class Span:
+    """
+    One timed step.  attrs holds what the step was about, e.g. the method
+    and path of an HTTP request, and can be added to with set or when it
+    finishes.
+
+    If the recorder measures memory, rss holds the resident set size when
+    the step finished and peak and peak_start the peak resident set size
+    of the process when it finished and started, all in bytes.
+    """
+    def __init__(self, recorder, name, attrs, depth):
+        self.name = name
+        self.attrs = attrs
+        self.depth = depth
+        self.thread = threading.currentThread().getName()
+        self.rss = self.peak = self.peak_start = None
+        if recorder.memory:
+            self.peak_start = peak_rss()
+        self.start = time.time()
+        self.duration = None
+        self._recorder = recorder
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, **attrs):
+        self.attrs.update(attrs)
+        self.duration = time.time() - self.start
+        if self._recorder.memory:
+            self.rss = rss()
+            self.peak = peak_rss()
+        self._recorder._finish(self)
+
+class _NullSpan:
+    # handed out while no Recorder is enabled, so timing costs nothing
+    def set(self, **attrs):
+        pass
+
+    def finish(self, **attrs):
+        pass
+
+_nullspan = _NullSpan()
+
+class Recorder:
+    """
+    Collects the spans of one run.  Spans started while another one is
+    running on the same thread are nested in it.  With memory, the spans
+    also measure the resident memory of the process.
+    """
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start(self, name, **attrs):
+        stack = self._stack()
+        span = Span(self, name, attrs, len(stack))
+        stack.append(span)
+        return span
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _finish(self, span):
+        stack = self._stack()
+        if span in stack:
+            stack.remove(span)
+        self._lock.acquire()
+        try:
+            self.spans.append(span)
+        finally:
+            self._lock.release()
+
+    def finished(self):
+        """
+        Returns the finished spans in the order they were started.
+        """
+        self._lock.acquire()
+        try:
+            spans = list(self.spans)
+        finally:
+            self._lock.release()
+        spans.sort(key=lambda span: span.start)
+        return spans
+
+    def report(self):
+        """
+        Returns the spans as lines of text, indented by nesting, with the
+        totals of each kind of span at the end.
+        """
+        lines = []
+        totals = {}
+        for span in self.finished():
+            attrs = ' '.join(['%s=%s' % (k, span.attrs[k])
+                              for k in sorted(span.attrs)])
+            lines.append('%9.1f ms  %s%s %s' % (span.duration * 1000,
+                                                '  ' * span.depth, span.name,
+                                                attrs))
+            count, total = totals.get(span.name, (0, 0.0))
+            totals[span.name] = (count + 1, total + span.duration)
+        lines.append('totals:')
+        for name in sorted(totals):
+            count, total = totals[name]
+            lines.append('%9.1f ms  %s (%d)' % (total * 1000, name, count))
+        return [line.rstrip() + '\n' for line in lines]
+
+    def memory_report(self, phases):
+        """
+        Returns lines of text with the memory use of each phase, a list of
+        (label, span name) pairs: the largest resident set size at the end
+        of its spans, the peak resident set size of the process by then,
+        and how much its spans raised the peak.
+        """
+        spans = self.finished()
+        mb = 1024.0 * 1024
+        lines = ['%-10s %10s %10s %10s\n' % ('phase (MB)', 'rss', 'peak',
+                                             'raised')]
+        for label, name in phases:
+            measured = [span for span in spans if span.name == name and
+                        span.rss is not None and span.peak is not None]
+            if not measured:
+                lines.append('%-10s %10s %10s %10s\n' % (label, '-', '-', '-'))
+                continue
+            raised = sum([span.peak - span.peak_start for span in measured])
+            lines.append('%-10s %10.1f %10.1f %10.1f\n' % (
+                label, max([span.rss for span in measured]) / mb,
+                max([span.peak for span in measured]) / mb, raised / mb))
+        return lines
+
+    def write(self, path, **fields):
+        """
+        Appends the spans to the file at path as JSON lines, one object per
+        span with its name, start, duration, thread and attributes, plus
+        fields.  Errors are ignored, the timings are only informational.
+        """
+        # not imported with the module, which is loaded for every hg command
+        import json
+        try:
+            fp = open(os.path.expanduser(path), 'a')
+            try:
+                for span in self.finished():
+                    record = dict(fields)
+                    record.update(span.attrs)
+                    record.update({'name': span.name, 'start': span.start,
+                                   'duration': span.duration,
+                                   'thread': span.thread,
+                                   'depth': span.depth})
+                    if self.memory:
+                        record.update({'rss': span.rss, 'peak': span.peak,
+                                       'peak_start': span.peak_start})
+                    fp.write(json.dumps(record, sort_keys=True) + '\n')
+            finally:
+                fp.close()
+        except (IOError, OSError):
+            pass
+
+
+_recorder = None
+
+def enable(memory=False):
+    """
+    Starts collecting spans in a new Recorder and returns it.
+    """
+    global _recorder
+    _recorder = Recorder(memory)
+    return _recorder
+
+def disable():
+    global _recorder
+    _recorder = None
+
+def start(name, **attrs):
+    """
+    Starts a span, which must be finished with its finish method.
+    """
+    recorder = _recorder
+    if recorder is None:
+        return _nullspan
+    return recorder.start(name, **attrs)
+
+def timed(name):
+    """
+    Decorates a function so that each call is a span called name.
+    """
+    def decorate(fn):
+        def timedfn(*args, **kwargs):
+            span = start(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                span.finish()
+        timedfn.__name__ = fn.__name__
+        timedfn.__doc__ = fn.__doc__
+        return timedfn
+    return decorate
@@ -0,0 +1,98 @@
+# a small thread pool for running review board requests concurrently
+
+import Queue
+import sys
+import threading
+import time
+
+class Job:
+    """
+    The pending result of a function submitted to a WorkerPool.
+    """
+    def __init__(self, fn, args, kwargs):
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        # seconds the function took to run
+        self.elapsed = None
+
+    def run(self):
+        start = time.time()
+        try:
+            self._result = self._fn(*self._args, **self._kwargs)
+        except:
+            self._exc_info = sys.exc_info()
+        self.elapsed = time.time() - start
+        self._done.set()
+
+    def done(self):
+        return self._done.isSet()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.done()
+
+    def result(self):
+        """
+        Waits for the job to finish and returns what the function returned,
+        or raises the exception it raised.
+        """
+        self._done.wait()
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+class WorkerPool:
+    """
+    Runs submitted functions on at most size threads.  The threads are
+    started as they are needed and end when the pool is shut down.
+    """
+    def __init__(self, size):
+        self.size = max(1, size)
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        job = Job(fn, args, kwargs)
+        self._lock.acquire()
+        try:
+            if len(self._threads) < self.size:
+                thread = threading.Thread(target=self._work)
+                thread.setDaemon(True)
+                thread.start()
+                self._threads.append(thread)
+        finally:
+            self._lock.release()
+        self._queue.put(job)
+        return job
+
+    def map(self, fn, *iterables):
+        """
+        Submits fn for every set of arguments and returns the jobs in the
+        same order.
+        """
+        return [self.submit(fn, *args) for args in zip(*iterables)]
+
+    def shutdown(self, wait=True):
+        self._lock.acquire()
+        try:
+            threads = self._threads
+            self._threads = []
+        finally:
+            self._lock.release()
+        for thread in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            job.run()